@@ -1,2 +1,21 @@
 __version__ = "0.1.0"
-from .ipif import IPIF
+
+__all__ = ["IPIF", "AsyncIPIF"]
+
+# The clients pull in requests/aiohttp and friends, so are only imported
+# when first used
+_LAZY_IMPORTS = {"IPIF": ".ipif", "AsyncIPIF": ".ipif_async"}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        from importlib import import_module
+
+        value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
@@ -0,0 +1,294 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class BaseResponseCache:
+    """Cache of IPIF responses, keyed by (endpoint_name, ipif_type, id)
+    for objects and (endpoint_name, ipif_type, search_params) for searches.
+
+    Holds at most max_size responses. Entries expire after ttl seconds (None
+    for never); not-found (None) and failed responses get their own, shorter,
+    TTLs. A TTL of 0 means the response is not kept at all.
+
+    Along with each response, HTTP validators (ETag and Last-Modified) can be
+    stored, so that a stale response can be revalidated with the endpoint.
+
+    Subclasses provide storage by implementing _load, _load_metadata, _store,
+    _delete, _clear and __len__.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, not_found_ttl=3600, failure_ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+        self.failure_ttl = failure_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _ttl_for(self, value):
+        if value is None:
+            return self.not_found_ttl
+        if isinstance(value, dict) and "IPIF_STATUS" in value:
+            return self.failure_ttl
+        return self.ttl
+
+    def lookup(self, key):
+        """Returns (True, value) if key is cached, otherwise (False, None),
+        counting hits and misses"""
+        value = self._load(key)
+        with self._stats_lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is _MISSING:
+            return False, None
+        return True, value
+
+    def set(self, key, value, ttl=None, validators=None):
+        """Cache value under key; the TTL defaults to the one for the kind
+        of response value is"""
+        ttl = self._ttl_for(value) if ttl is None else ttl
+        if ttl == 0:
+            self._delete(key)
+        else:
+            self._store(key, value, ttl, validators or {})
+
+    def metadata(self, key):
+        """Returns (age in seconds, validators dict) for a cached key,
+        or (None, {}) if it is not cached"""
+        return self._load_metadata(key)
+
+    def invalidate(self, key=None, endpoint_name=None):
+        """Remove a single key, everything from one endpoint, or
+        (with no arguments) everything from the cache"""
+        if key is not None:
+            self._delete(key)
+        else:
+            self._clear(endpoint_name)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def __contains__(self, key):
+        return self._load(key) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self._load(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.invalidate(key)
+
+
+class ResponseCache(BaseResponseCache):
+    """In-memory response cache, evicting the least recently used
+    responses once full"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+
+            value, expires, _, _ = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _load_metadata(self, key):
+        with self._lock:
+            if self._load(key) is _MISSING:
+                return None, {}
+            _, _, stored, validators = self._entries[key]
+            return time.monotonic() - stored, validators
+
+    def _store(self, key, value, ttl, validators):
+        now = time.monotonic()
+        expires = now + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires, now, validators)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _clear(self, endpoint_name=None):
+        with self._lock:
+            if endpoint_name is None:
+                self._entries.clear()
+            else:
+                for k in [k for k in self._entries if k[0] == endpoint_name]:
+                    del self._entries[k]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteResponseCache(BaseResponseCache):
+    """Response cache stored in an SQLite database at path, so that it
+    persists between runs and can be shared by several processes.
+
+    Responses are stored as JSON. Expired responses are never returned, but
+    they are only deleted, along with the oldest responses beyond max_size,
+    by prune(). That runs every prune_every writes, so the cache can exceed
+    max_size by up to that many responses in between.
+    """
+
+    def __init__(self, path, *args, prune_every=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = os.fspath(path)
+        self.prune_every = prune_every
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        # sqlite3 connections can't be shared between threads, so each
+        # thread gets its own
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, endpoint TEXT, value TEXT, "
+                "validators TEXT, stored REAL, expires REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_stored ON responses (stored)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            # Write-ahead logging lets readers in other processes carry on
+            # while one process writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _serialize_key(key):
+        return json.dumps(key)
+
+    def _load(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, expires FROM responses WHERE key = ?",
+                (self._serialize_key(key),),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return _MISSING
+
+        value, expires = row
+        if expires is not None and expires <= time.time():
+            self._delete(key)
+            return _MISSING
+
+        return json.loads(value)
+
+    def _load_metadata(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT validators, stored, expires FROM responses WHERE key = ?",
+                (self._serialize_key(key),),
+            )
+            .fetchone()
+        )
+        now = time.time()
+        if row is None or (row[2] is not None and row[2] <= now):
+            return None, {}
+
+        validators, stored, _ = row
+        return now - stored, json.loads(validators)
+
+    def _store(self, key, value, ttl, validators):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self._serialize_key(key),
+                    key[0],
+                    json.dumps(value),
+                    json.dumps(validators),
+                    now,
+                    now + ttl if ttl is not None else None,
+                ),
+            )
+
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes >= self.prune_every
+            if due:
+                self._writes = 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        """Delete expired responses, then the oldest beyond max_size"""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+            (size,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if size > self.max_size:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                    "ORDER BY stored LIMIT ?)",
+                    (size - self.max_size,),
+                )
+
+    def _delete(self, key):
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM responses WHERE key = ?", (self._serialize_key(key),)
+            )
+
+    def _clear(self, endpoint_name=None):
+        with self._connection() as conn:
+            if endpoint_name is None:
+                conn.execute("DELETE FROM responses")
+            else:
+                conn.execute(
+                    "DELETE FROM responses WHERE endpoint = ?", (endpoint_name,)
+                )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def __len__(self):
+        return (
+            self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        )
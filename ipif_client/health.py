@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class EndpointHealth:
+    """Health of one endpoint, with a circuit breaker.
+
+    The outcome and latency of the last window requests are kept. The circuit
+    opens, so requests to the endpoint are skipped rather than made, after
+    failure_threshold failures in a row, or once at least min_requests have
+    been made and error_rate_threshold of them failed. After reset_timeout
+    seconds it goes half-open: one probe request is let through, and closes
+    the circuit again if it succeeds, or reopens it if not.
+
+    Set enabled=False to track health without ever opening the circuit.
+    """
+
+    def __init__(
+        self,
+        window=100,
+        failure_threshold=5,
+        error_rate_threshold=0.5,
+        min_requests=20,
+        reset_timeout=30,
+        enabled=True,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.enabled = enabled
+        self._clock = clock
+
+        # (succeeded, latency in seconds)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._outcomes.clear()
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def allow_request(self):
+        """Whether a request should be made to the endpoint now"""
+        with self._lock:
+            if self.state == CLOSED or not self.enabled:
+                return True
+            if (
+                self.state == OPEN
+                and self._clock() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def abandon(self):
+        """A request that was allowed was not made, or its outcome is unknown
+        (e.g. it was interrupted): if it was the probe, let another through"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, succeeded, latency):
+        """Record the outcome of a request made to the endpoint"""
+        with self._lock:
+            self._outcomes.append((succeeded, latency))
+            self._probing = False
+
+            if succeeded:
+                self.consecutive_failures = 0
+                if self.state == HALF_OPEN:
+                    self.state = CLOSED
+                return
+
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self._should_open():
+                self.state = OPEN
+                self.opened_at = self._clock()
+
+    def _should_open(self):
+        if not self.enabled:
+            return False
+        if self.consecutive_failures >= self.failure_threshold:
+            return True
+        return (
+            len(self._outcomes) >= self.min_requests
+            and self._error_rate() >= self.error_rate_threshold
+        )
+
+    def _error_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return sum(not ok for ok, _ in self._outcomes) / len(self._outcomes)
+
+    @staticmethod
+    def _percentile(ordered, p):
+        if not ordered:
+            return None
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    def snapshot(self):
+        """A dict of the endpoint's circuit state, error rate and latency
+        percentiles (in seconds) over the window"""
+        with self._lock:
+            latencies = sorted(latency for _, latency in self._outcomes)
+            return {
+                "state": self.state,
+                "requests": len(self._outcomes),
+                "error_rate": self._error_rate(),
+                "consecutive_failures": self.consecutive_failures,
+                "latency_p50": self._percentile(latencies, 50),
+                "latency_p95": self._percentile(latencies, 95),
+                "latency_p99": self._percentile(latencies, 99),
+            }
@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import threading
+
+from ipif_client.utils.reconcile import reconciliation_keys
+
+
+class IdentifierIndex:
+    """Index of which local @id each endpoint uses for an entity known by
+    a given identifier, learned from responses. Identifiers are its uris,
+    which are global, and its @id on each endpoint, which is only unique on
+    that endpoint (so is kept with the endpoint's name).
+
+    With this, an entity already seen on an endpoint can be requested by its
+    local @id directly, rather than probing the endpoint with every URI.
+    If path is given, the index is loaded from it, and can be saved back to it.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.fspath(path) if path else None
+        # {(ipif_type, reconciliation key): {endpoint_name: local_id}}
+        self._index = {}
+        self._lock = threading.Lock()
+
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                for entry in json.load(f):
+                    # Entries from before @ids were kept with their endpoint
+                    # are left out, as they can't be told apart from uris
+                    if len(entry) == 3 and isinstance(entry[1], list):
+                        ipif_type, key, local_ids = entry
+                        self._index[(ipif_type, tuple(key))] = local_ids
+
+    def learn(self, endpoint_name, ipif_type, data):
+        """Index the identifiers of an entity returned by endpoint_name"""
+        self.learn_equivalents(ipif_type, [(endpoint_name, data)])
+
+    def learn_equivalents(self, ipif_type, items):
+        """Index [(endpoint_name, data), ...] that are all the same entity,
+        so that any of their identifiers leads to every endpoint's local @id"""
+        keys = [
+            key
+            for endpoint_name, data in items
+            for key in reconciliation_keys(endpoint_name, data)
+        ]
+        for endpoint_name, data in items:
+            local_id = data.get("@id")
+            if not local_id:
+                continue
+            with self._lock:
+                for key in keys:
+                    self._index.setdefault((ipif_type.lower(), key), {})[
+                        endpoint_name
+                    ] = local_id
+
+    def local_ids(self, ipif_type, uris=(), endpoint_ids=()):
+        """Returns {endpoint_name: local_id} for the entity known by any of
+        uris, or by any of the (endpoint_name, local_id) endpoint_ids, for each
+        endpoint where it has been seen"""
+        keys = [("uri", uri) for uri in uris] + [
+            ("@id", endpoint_name, local_id) for endpoint_name, local_id in endpoint_ids
+        ]
+        found = {}
+        with self._lock:
+            for key in keys:
+                for endpoint_name, local_id in self._index.get(
+                    (ipif_type.lower(), key), {}
+                ).items():
+                    found.setdefault(endpoint_name, local_id)
+        return found
+
+    def save(self, path=None):
+        """Save the index to path (by default, the one it was loaded from).
+        It is written to a temporary file that then replaces the file, so the
+        file is never left half written."""
+        path = os.fspath(path or self.path)
+        with self._lock:
+            data = [
+                [ipif_type, list(key), local_ids]
+                for (ipif_type, key), local_ids in self._index.items()
+            ]
+
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def __len__(self):
+        return len(self._index)
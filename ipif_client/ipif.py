@@ -1,13 +1,23 @@
 import math
 import time
-from typing import Dict
-
-import requests
-from yaspin import yaspin
-from yaspin.spinners import Spinners
-
-
-from ipif_client.exceptions import IPIFClientConfigurationError
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+from ipif_client.cache import ResponseCache, SQLiteResponseCache
+from ipif_client.identifier_index import IdentifierIndex
+from ipif_client.exceptions import IPIFClientConfigurationError, IPIFClientDataError
+from ipif_client.health import EndpointHealth
+from ipif_client.progress import progress_factory
+from ipif_client.ratelimit import EndpointLimits
+from ipif_client.retry import RetryPolicy
+from ipif_client.utils.jsonlib import (
+    STREAM_CHUNK_SIZE,
+    SearchPageParser,
+    json_loads,
+)
+from ipif_client.utils.singleflight import SingleFlight
 from ipif_client.ipif_entity_types import (
     IPIFFactoids,
     IPIFPersons,
@@ -32,61 +42,169 @@ def _error_if_no_endpoints(func):
 
 
 class IPIF:
-    def _build_queryset_class(self, qs_class_name):
+    _queryset_base_class = IPIFQuerySet
+
+    def _build_queryset_class(self, qs_class_name, entity_class):
         """Creates an IPIFQuerySet subclass type to be bound to
         an IPIF instance, giving access via _ipif_instance variable
-        back to the instance of this class"""
+        back to the instance of this class, and to the IPIFType
+        class of its results via _entity_class"""
         return type(
             qs_class_name,
-            (IPIFQuerySet,),
-            {"_ipif_instance": self},
+            (self._queryset_base_class,),
+            {"_ipif_instance": self, "_entity_class": entity_class},
+        )
+
+    def _build_entity_class(self, class_name, base_class):
+        """Creates an IPIFType subclass type bound to this IPIF instance"""
+        return type(
+            class_name, (base_class,), {"_ipif_instance": self, "__slots__": ()}
         )
 
+    def _build_session(self):
+        # All requests go through one session, so connections to each
+        # endpoint are kept alive and reused. (requests is slow to import,
+        # so isn't until a client is made.)
+        import requests
+
+        return requests.Session()
+
     def __init__(self, config={}):
         """Create a new IPIF client.
 
         Pass config dict with options:
-        "endpoints": {"name": "SHORT_NAME", "uri": "URI OF ENDPOINT"}
+        "endpoints": {"SHORT_NAME": "URI OF ENDPOINT"}, or to set per-endpoint limits,
+            {"SHORT_NAME": {"uri": "URI OF ENDPOINT", "rate_limit": 5, "burst": 10,
+            "max_in_flight": 4}} (see add_endpoint)
+        "max_concurrent_requests": size of the pool of concurrent requests (default 8)
+            used for by-id lookups across endpoints, ids(), hydration and prefetching,
+            hounding for alternate URIs, and searching every endpoint at once (when
+            reconciling or counting). The pages of a search are limited by
+            page_prefetch instead
+        "timeout": seconds to wait for each endpoint to respond (default None, i.e. wait)
+        "page_prefetch": number of search result pages to request ahead (default 4)
+        "stream": parse each page of search results as it arrives, yielding results
+            as they are parsed rather than once the page is complete (default False).
+            Pages are then requested one at a time, and only parsed incrementally
+            if ijson is installed
+        "json_library": library to decode responses with: "json" (default), "orjson",
+            "ujson", or "auto" for the fastest installed
+        "pool_size": number of kept-alive connections per endpoint (default 10)
+        "retry_policy": a RetryPolicy deciding which failed requests to retry, and
+            how long to back off first (default RetryPolicy(), up to 5 attempts)
+        "retries": shorthand for RetryPolicy(max_attempts=retries + 1)
+        "progress": "auto" to show a spinner while requesting only when running in a
+            terminal (default), True or False to always or never show it, or a
+            callable returning a progress reporter (see ipif_client.progress)
+        "keep_data_dict": whether entities keep the raw JSON they were built from,
+            for item access like person["uris"] (default True); False saves memory
+        "circuit_breaker": dict of EndpointHealth options for when to stop sending
+            requests to a failing endpoint for a while, or False to never stop
+        "cache": a ResponseCache (or compatible) instance to cache responses in
+        "cache_path": path of an SQLite file to cache responses in, if no cache given
+        "revalidate_after": seconds after which a cached object is revalidated with
+            its endpoint using ETag/Last-Modified (default None, i.e. never)
+        "hound_max_depth": rounds of alternative URIs to try in hound mode (default 3)
+        "hound_max_requests": most requests to make per entity in hound mode (default 50)
+        "identifier_index_path": file to load and save the index of which @id each
+            endpoint uses for each URI, so it persists between runs
         """
         self._DEFAULT_PAGE_REQUEST_SIZE = 30
+        self._max_concurrent_requests = config.get("max_concurrent_requests", 8)
+        self._timeout = config.get("timeout", None)
+        self._page_prefetch = config.get("page_prefetch", 4)
+        self._stream = config.get("stream", False)
+        self._loads = json_loads(config.get("json_library", "json"))
+        self._pool_size = config.get("pool_size", 10)
+        self._retry_policy = config.get("retry_policy")
+        if self._retry_policy is None and config.get("retries") is not None:
+            self._retry_policy = RetryPolicy(max_attempts=config["retries"] + 1)
+        elif self._retry_policy is None:
+            self._retry_policy = RetryPolicy()
+        self._revalidate_after = config.get("revalidate_after", None)
+        self._progress = progress_factory(config.get("progress", "auto"))
+        self._keep_data_dict = config.get("keep_data_dict", True)
+
+        circuit_breaker = config.get("circuit_breaker", {})
+        self._circuit_breaker = (
+            circuit_breaker if circuit_breaker is not False else {"enabled": False}
+        )
+        # Health and request limits of each endpoint, by name
+        self._health = {}
+        self._limits = {}
+
+        self._session = self._build_session()
 
         self._endpoints = {}
         self._preferred_endpoint = None
         self._hound_mode = True
+        self._hound_max_depth = config.get("hound_max_depth", 3)
+        self._hound_max_requests = config.get("hound_max_requests", 50)
+
+        # Requests in flight, so that concurrent identical requests are only
+        # made once
+        self._single_flight = SingleFlight()
+
+        # Cache of responses, for both id and search requests
+        self._data_cache = config.get("cache")
+        if self._data_cache is None and config.get("cache_path"):
+            self._data_cache = SQLiteResponseCache(config["cache_path"])
+        elif self._data_cache is None:
+            self._data_cache = ResponseCache()
+
+        # -ref objects already built, by (type, endpoint, @id), so that each
+        # entity referred to is only built once; weak, so unused ones are freed
+        self._identity_map = weakref.WeakValueDictionary()
 
-        # Dict for caching responses. Maybe make this a class so we're not
-        # having to do loads of dict methods on it, and can change the
-        # implememntation
-        self._data_cache: Dict = {}
+        # Which local @id each endpoint uses for each known identifier,
+        # learned from responses
+        self._identifier_index = IdentifierIndex(config.get("identifier_index_path"))
 
         # Unpack endpoints from config into instance's endpoint dict
         if "endpoints" in config:
             for label, endpoint in config["endpoints"].items():
-                self.add_endpoint(name=label, uri=endpoint)
+                if isinstance(endpoint, dict):
+                    self.add_endpoint(name=label, **endpoint)
+                else:
+                    self.add_endpoint(name=label, uri=endpoint)
 
         # Create IPIF-type classes on the instance
         # each instance has its own classes, so class itself holds reference back
         # to this class. (This so so we can do ipif.Person.id() etc. in Django fashion;
         # but also keep each of these classes bound to their IPIF instance)
-        self.Persons = type("Person", (IPIFPersons,), {"_ipif_instance": self})
-        self.Statements = type("Statement", (IPIFStatements,), {"_ipif_instance": self})
-        self.Factoids = type("Factoid", (IPIFFactoids,), {"_ipif_instance": self})
-        self.Sources = type("Source", (IPIFSources,), {"_ipif_instance": self})
+        self.Persons = self._build_entity_class("Person", IPIFPersons)
+        self.Statements = self._build_entity_class("Statement", IPIFStatements)
+        self.Factoids = self._build_entity_class("Factoid", IPIFFactoids)
+        self.Sources = self._build_entity_class("Source", IPIFSources)
 
         # Also set up a QuerySet and add it to the class for reference
-        self._PersonsQuerySet = self._build_queryset_class("PersonsQuerySet")
+        self._PersonsQuerySet = self._build_queryset_class(
+            "PersonsQuerySet", self.Persons
+        )
         self.Persons._queryset = self._PersonsQuerySet
 
-        self._StatementsQuerySet = self._build_queryset_class("StatementsQuerySet")
+        self._StatementsQuerySet = self._build_queryset_class(
+            "StatementsQuerySet", self.Statements
+        )
         self.Statements._queryset = self._StatementsQuerySet
 
-        self._FactoidsQuerySet = self._build_queryset_class("FactoidsQuerySet")
+        self._FactoidsQuerySet = self._build_queryset_class(
+            "FactoidsQuerySet", self.Factoids
+        )
         self.Factoids._queryset = self._FactoidsQuerySet
 
-        self._SourcesQuerySet = self._build_queryset_class("SourcesQuerySet")
+        self._SourcesQuerySet = self._build_queryset_class(
+            "SourcesQuerySet", self.Sources
+        )
         self.Sources._queryset = self._SourcesQuerySet
 
-    def add_endpoint(self, name=None, uri=None):
+    def add_endpoint(
+        self, name=None, uri=None, rate_limit=None, burst=None, max_in_flight=None
+    ):
+        """Add an endpoint called name at uri.
+
+        To be kind to the server, requests to it can be limited to rate_limit
+        per second (in bursts of up to burst), and max_in_flight at once."""
         if not name or not uri:
             raise IPIFClientConfigurationError(
                 "An IPIF endpoint requires a label and endpoint uri"
@@ -104,145 +222,630 @@ class IPIF:
             )
 
         self._endpoints[name] = uri
+        self._health[name] = EndpointHealth(**self._circuit_breaker)
+        self._limits[name] = EndpointLimits(rate_limit, burst, max_in_flight)
+        self._mount_endpoint(uri)
+
+    def endpoint_health(self, endpoint_name=None):
+        """The circuit state, error rate and latency percentiles of each endpoint,
+        as {endpoint_name: {...}}, or of just one endpoint if named"""
+        if endpoint_name is not None:
+            return self._health[endpoint_name].snapshot()
+        return {name: health.snapshot() for name, health in self._health.items()}
+
+    def reset_endpoint_health(self, endpoint_name=None):
+        """Forget the health of one endpoint (or all of them), closing its circuit"""
+        for name, health in self._health.items():
+            if endpoint_name is None or name == endpoint_name:
+                health.reset()
+
+    def _mount_endpoint(self, uri):
+        from requests.adapters import HTTPAdapter
+
+        # Give each endpoint its own connection pool; retrying is left
+        # to the retry policy
+        self._session.mount(
+            uri,
+            HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size),
+        )
+
+    def close(self):
+        """Close any connections held open to the endpoints, and save the
+        identifier index if it has a file"""
+        self._session.close()
+        self.save_identifier_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save_identifier_index(self):
+        if self._identifier_index.path:
+            self._identifier_index.save()
+
+    def _learn_identifiers(self, endpoint_name, ipif_type, results):
+        """Add Persons and Sources in results to the identifier index"""
+        if ipif_type.lower() not in ("persons", "sources"):
+            return
+        for data in results:
+            if data and "IPIF_STATUS" not in data:
+                self._identifier_index.learn(endpoint_name, ipif_type, data)
+
+    def _endpoint_ids(self, ipif_type, id_string, endpoint_names):
+        """The id to request from each endpoint: its own local @id for the
+        entity if id_string is a URI in the identifier index, otherwise
+        id_string. (A bare @id could be any endpoint's, so is not looked up.)"""
+        local_ids = self._identifier_index.local_ids(ipif_type, uris=[id_string])
+        return [
+            (endpoint_name, local_ids.get(endpoint_name, id_string))
+            for endpoint_name in endpoint_names
+        ]
+
+    def _object_url(self, endpoint_name, ipif_type, id_string):
+        return f"{self._endpoints[endpoint_name]}{ipif_type.lower()}/{id_string}"
+
+    def _search_url(self, endpoint_name, ipif_type):
+        return f"{self._endpoints[endpoint_name]}{ipif_type.lower()}"
+
+    def _get_cached_object(self, cache_key):
+        """Returns (True, data, None) if there is a fresh cached response for
+        cache_key. Otherwise returns (False, cached data, headers), where headers
+        makes a conditional request if a stale cached response can be revalidated."""
+        is_cached, data = self._data_cache.lookup(cache_key)
+        if not is_cached:
+            return False, None, {}
+
+        if (
+            self._revalidate_after is None
+            or data is None
+            or data == {"IPIF_STATUS": "Request failed"}
+        ):
+            return True, data, None
+
+        age, validators = self._data_cache.metadata(cache_key)
+        if age is not None and age < self._revalidate_after:
+            return True, data, None
+
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return False, data, headers
+
+    def _cache_object_response(
+        self, cache_key, status_code, data=None, headers=None, cached_data=None
+    ):
+        """Caches and returns the result of an object request: the data
+        if found (or the cached data if not modified), None if 404,
+        otherwise a failure marker. If revalidating cached data failed, the
+        stale data is returned, and left cached."""
+        if status_code == 200 or (status_code == 304 and cached_data is not None):
+            result = data if status_code == 200 else cached_data
+            self._learn_identifiers(cache_key[0], cache_key[1], [result])
+            headers = headers or {}
+            validators = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+            if status_code == 304:
+                # A 304 need not repeat every validator, so keep the ones
+                # it leaves out
+                _, cached_validators = self._data_cache.metadata(cache_key)
+                validators = {
+                    name: value if value is not None else cached_validators.get(name)
+                    for name, value in validators.items()
+                }
+            self._data_cache.set(cache_key, result, validators=validators)
+            return result
+        elif status_code == 404:
+            result = None
+        elif cached_data is not None:
+            return cached_data
+        else:
+            result = {"IPIF_STATUS": "Request failed"}
+
+        self._data_cache.set(cache_key, result)
+        return result
+
+    @staticmethod
+    def _search_cache_key(endpoint_name, ipif_type, search_params):
+        return (endpoint_name, ipif_type, tuple(sorted(search_params.items())))
+
+    def invalidate_cache(self, endpoint_name=None):
+        """Drop cached responses, for one endpoint or all of them"""
+        self._data_cache.invalidate(endpoint_name=endpoint_name)
 
     @_error_if_no_endpoints
     def _request_single_object_by_id(self, endpoint_name, ipif_type, id_string):
-        if (
-            endpoint_name,
-            ipif_type,
-            id_string,
-        ) in self._data_cache and self._data_cache[
-            (endpoint_name, ipif_type, id_string)
-        ] != {
-            "IPIF_STATUS": "Request failed"
-        }:
-            return self._data_cache[(endpoint_name, ipif_type, id_string)]
-
-        URL = f"{self._endpoints[endpoint_name]}{ipif_type.lower()}/{id_string}"
+        cache_key = (endpoint_name, ipif_type, id_string)
+        # Concurrent requests for the same object wait on the first one
+        return self._single_flight.do(
+            cache_key, self._fetch_single_object_by_id, cache_key
+        )
+
+    def _fetch_single_object_by_id(self, cache_key):
+        is_fresh, cached_data, request_headers = self._get_cached_object(cache_key)
+        if is_fresh:
+            return cached_data
+
+        endpoint_name = cache_key[0]
+        URL = self._object_url(*cache_key)
         # print(f"Getting {URL}...")
-        try:
-            resp = requests.get(URL)
+        resp = self._get(endpoint_name, URL, headers=request_headers)
+        if resp is None:
+            return self._cache_object_response(cache_key, None, cached_data=cached_data)
+
+        return self._cache_object_response(
+            cache_key,
+            resp.status_code,
+            self._loads(resp.content) if resp.status_code == 200 else None,
+            headers=resp.headers,
+            cached_data=cached_data,
+        )
 
-        except requests.exceptions.ConnectionError:
-            self._data_cache[(endpoint_name, ipif_type, id_string)] = {
-                "IPIF_STATUS": "Request failed"
-            }
-            return {"IPIF_STATUS": "Request failed"}
+    def _get(self, endpoint_name, URL, **kwargs):
+        """GET URL from endpoint_name, within the endpoint's rate limits,
+        retrying as the retry policy allows. Returns the last response, or None
+        if the connection failed (or timed out), or the endpoint's circuit
+        breaker is open."""
+        from requests.exceptions import RequestException
+
+        health = self._health[endpoint_name]
+        limits = self._limits[endpoint_name]
+        resp = None
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            if not health.allow_request():
+                return resp
+
+            attempt += 1
+            sent = time.monotonic()
+            try:
+                with limits.in_flight():
+                    wait = limits.reserve()
+                    if wait:
+                        timeout_wrapper(wait)
+
+                    sent = time.monotonic()
+                    try:
+                        resp = self._session.get(URL, timeout=self._timeout, **kwargs)
+                        status, headers = resp.status_code, resp.headers
+                    except RequestException:
+                        resp, status, headers = None, None, {}
+            except Exception:
+                # Every request allowed must be recorded, or a half-open
+                # circuit would wait for its probe forever
+                health.record(False, time.monotonic() - sent)
+                raise
+            except BaseException:
+                # Interrupted, which says nothing about the endpoint
+                health.abandon()
+                raise
+            health.record(status is not None and status < 500, time.monotonic() - sent)
+
+            if status is not None and status < 400:
+                return resp
+
+            delay = self._retry_policy.next_delay(
+                attempt, status, headers, time.monotonic() - start
+            )
+            if delay is None:
+                return resp
+            if resp is not None:
+                # Give the connection back, in case the body was not read
+                resp.close()
+            timeout_wrapper(delay)
+
+    def _run_concurrently(self, func, args_list):
+        """Calls func with each tuple of args in args_list using a bounded
+        thread pool, yielding (args, result) pairs as each call completes."""
+        if not args_list:
+            return
 
-        if resp.status_code == 200:
-            data = resp.json()
-            self._data_cache[(endpoint_name, ipif_type, id_string)] = data
-            return data
-        elif resp.status_code == 404:
-            self._data_cache[(endpoint_name, ipif_type, id_string)] = None
-            return None
-        else:
-            self._data_cache[(endpoint_name, ipif_type, id_string)] = {
-                "IPIF_STATUS": "Request failed"
-            }
-            return {"IPIF_STATUS": "Request failed"}
+        max_workers = max(1, min(self._max_concurrent_requests, len(args_list)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(func, *args): args for args in args_list}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # Don't make calls nobody is going to read if we stop early
+                for future in futures:
+                    future.cancel()
 
     @_error_if_no_endpoints
     def _request_id_from_endpoints(self, ipif_type, id_string, specify_endpoints=set()):
+        """Requests an object by id from all endpoints (or those in specify_endpoints)
+        at once, returning a dict of {endpoint_name: data} for endpoints with a result
+        or a failure."""
         results = {}
 
-        endpoints_to_get = specify_endpoints or self._endpoints
-
-        with yaspin(Spinners.earth, color="magenta", timer=True) as sp:
-            for endpoint_name in endpoints_to_get:
-                sp.text = f"Getting {ipif_type} @id='{id_string}' from {endpoint_name}"
-
-                result = self._request_single_object_by_id(
-                    endpoint_name, ipif_type, id_string
-                )
+        endpoints_to_get = [
+            endpoint_name
+            for endpoint_name in self._endpoints
+            if not specify_endpoints or endpoint_name in specify_endpoints
+        ]
+
+        with self._progress() as sp:
+            sp.text = f"Getting {ipif_type} @id='{id_string}' from {', '.join(endpoints_to_get)}"
+
+            for (endpoint_name, _, _), result in self._run_concurrently(
+                self._request_single_object_by_id,
+                [
+                    (endpoint_name, ipif_type, endpoint_id)
+                    for endpoint_name, endpoint_id in self._endpoint_ids(
+                        ipif_type, id_string, endpoints_to_get
+                    )
+                ],
+            ):
                 if result:
                     results[endpoint_name] = result
 
                 if result and result != {"IPIF_STATUS": "Request failed"}:
-                    sp.ok("✅ ")
-                    pass
+                    sp.write(f"✅ {endpoint_name}")
                 else:
-                    sp.fail("💥 ")
-                    pass
+                    sp.write(f"💥 {endpoint_name}")
+
+        # Keep results in endpoint order, whatever order the requests completed in
+        return {e: results[e] for e in endpoints_to_get if e in results}
+
+    @_error_if_no_endpoints
+    def _iter_ids_from_endpoints(self, type_and_ids):
+        """Requests many (ipif_type, id_string) objects from all endpoints at once,
+        through one bounded pool, yielding ((ipif_type, id_string),
+        {endpoint_name: data}) for each as soon as every endpoint has responded"""
+        type_and_ids = list(dict.fromkeys(type_and_ids))
+
+        # Different ids may be the same request, if the identifier index
+        # maps them to the same local @id
+        requests = {}
+        for type_and_id in type_and_ids:
+            for endpoint_name, endpoint_id in self._endpoint_ids(
+                *type_and_id, self._endpoints
+            ):
+                requests.setdefault(
+                    (endpoint_name, type_and_id[0], endpoint_id), []
+                ).append(type_and_id)
+
+        results = {type_and_id: {} for type_and_id in type_and_ids}
+        remaining = {type_and_id: len(self._endpoints) for type_and_id in type_and_ids}
+
+        with self._progress() as sp:
+            sp.text = (
+                f"Getting {len(type_and_ids)} objects from {', '.join(self._endpoints)}"
+            )
 
-        return results
+            for request, result in self._run_concurrently(
+                self._request_single_object_by_id, list(requests)
+            ):
+                for type_and_id in requests[request]:
+                    if result:
+                        results[type_and_id][request[0]] = result
+                    remaining[type_and_id] -= 1
+                    if not remaining[type_and_id]:
+                        # Keep each result dict in endpoint order
+                        resp = results.pop(type_and_id)
+                        yield type_and_id, {
+                            e: resp[e] for e in self._endpoints if e in resp
+                        }
+
+    @_error_if_no_endpoints
+    def _request_ids_from_endpoints(self, type_and_ids):
+        """Requests many (ipif_type, id_string) objects from all endpoints at once,
+        through one bounded pool, returning a dict of
+        {(ipif_type, id_string): {endpoint_name: data}}"""
+        type_and_ids = list(dict.fromkeys(type_and_ids))
+        found = dict(self._iter_ids_from_endpoints(type_and_ids))
+        return {type_and_id: found[type_and_id] for type_and_id in type_and_ids}
+
+    @staticmethod
+    def _refs_to_hydrate(objects):
+        """Group the -ref objects in objects by (class, id), so each distinct
+        entity is only fetched once"""
+        refs = {}
+        for obj in objects:
+            if obj._ref_only:
+                refs.setdefault((type(obj), obj.id), []).append(obj)
+        return refs
+
+    @staticmethod
+    def _next_hydration_level(objects, seen):
+        """The related objects of objects not seen before"""
+        level = []
+        for obj in objects:
+            for related in obj._related_objects():
+                if id(related) not in seen:
+                    seen.add(id(related))
+                    level.append(related)
+        return level
+
+    def _hydrate_refs(self, objects):
+        refs = self._refs_to_hydrate(objects)
+        if not refs:
+            return
+
+        responses = self._request_ids_from_endpoints(
+            (cls.__name__.lower() + "s", id_string) for cls, id_string in refs
+        )
+        for (cls, id_string), ref_objects in refs.items():
+            try:
+                new = cls._from_id_responses(
+                    responses[(cls.__name__.lower() + "s", id_string)], id_string
+                )
+            except IPIFClientDataError:
+                # Ambiguous refs are left alone, to complain when accessed
+                continue
+            if new:
+                for obj in ref_objects:
+                    obj._update_from(new)
+
+    def hydrate(self, objects, depth=1):
+        """Fetch the full data of -ref objects in bulk, rather than one at
+        a time as their attributes are accessed.
+
+        objects is an IPIF entity or an iterable of them. Any of them that are
+        -refs are fetched, then the entities they refer to (factoids, sources,
+        persons, statements) down to depth levels. All the refs at each level
+        are deduplicated and fetched concurrently. Returns objects."""
+        level = [objects] if hasattr(objects, "_ref_only") else list(objects)
+        seen = {id(obj) for obj in level}
+
+        for _ in range(depth + 1):
+            if not level:
+                break
+            self._hydrate_refs(level)
+            level = self._next_hydration_level(level, seen)
+
+        return objects
 
     @_error_if_no_endpoints
     def _base_query_request(
         self, endpoint_name, ipif_type, search_params, statement_params={}
     ):
-        URL = f"{self._endpoints[endpoint_name]}{ipif_type.lower()}"
-
-        # CACHE IT HERE SO WE DON'T NEED TO WORRY ELSEWHERE.
+        cache_key = self._search_cache_key(endpoint_name, ipif_type, search_params)
+        # Concurrent identical searches wait on the first one
+        return self._single_flight.do(
+            cache_key,
+            self._fetch_search_results,
+            endpoint_name,
+            ipif_type,
+            search_params,
+            cache_key,
+        )
 
-        try:
+    def _fetch_search_results(self, endpoint_name, ipif_type, search_params, cache_key):
+        is_cached, data = self._data_cache.lookup(cache_key)
+        if is_cached:
+            return data
 
-            resp = requests.get(URL, params=search_params)
-            # print(resp.url)
-            # print(resp.status_code)
-        except requests.exceptions.ConnectionError:
+        URL = self._search_url(endpoint_name, ipif_type)
+        resp = self._get(endpoint_name, URL, params=search_params)
+        if resp is None:
             return None
 
         if resp.status_code == 200:
             # Unlike getting the ID, we actually want to return the
             # results set, even if empty
-            return resp.json()
+            data = self._loads(resp.content)
+            self._data_cache.set(cache_key, data)
+            self._learn_identifiers(
+                endpoint_name, ipif_type, data.get(ipif_type.lower(), [])
+            )
+            return data
         else:
             return None
 
+    def _request_page(self, endpoint_name, ipif_type, search_params, page, size):
+        """Requests a single page of search results (retried as the retry
+        policy allows), returning None if it failed"""
+        sps = {**search_params, "page": page, "size": size}
+        return self._base_query_request(endpoint_name, ipif_type, sps) or None
+
+    def _stream_search_results(self, endpoint_name, ipif_type, search_params, page):
+        """Yields the results of a search as they are parsed from the response,
+        then fills in page with the page's "protocol", or "failed" if the request
+        failed. The page is cached once it has all been read."""
+        from requests.exceptions import RequestException
+
+        results_key = ipif_type.lower()
+        cache_key = self._search_cache_key(endpoint_name, ipif_type, search_params)
+        is_cached, data = self._data_cache.lookup(cache_key)
+        if is_cached:
+            yield from data[results_key]
+            page["protocol"] = data["protocol"]
+            return
+
+        URL = self._search_url(endpoint_name, ipif_type)
+        resp = self._get(endpoint_name, URL, params=search_params, stream=True)
+        if resp is None:
+            page["failed"] = True
+            return
+
+        parser = SearchPageParser(results_key, self._loads)
+        results = []
+        with resp:
+            if resp.status_code != 200:
+                page["failed"] = True
+                return
+            try:
+                for chunk in resp.iter_content(STREAM_CHUNK_SIZE):
+                    for result in parser.feed(chunk):
+                        results.append(result)
+                        yield result
+                remaining = parser.close()
+            except (RequestException, ValueError):
+                page["failed"] = True
+                return
+        results += remaining
+        yield from remaining
+
+        page["protocol"] = parser.protocol
+        self._data_cache.set(
+            cache_key, {"protocol": parser.protocol, results_key: results}
+        )
+        self._learn_identifiers(endpoint_name, ipif_type, results)
+
+    def _iterate_streamed_results(self, endpoint_name, ipif_type, search_params):
+        """Yields all the results of a search from one endpoint, each page
+        streamed in turn"""
+        size = self._DEFAULT_PAGE_REQUEST_SIZE
+        page_num, number_pages = 1, 1
+        while page_num <= number_pages:
+            sps = {**search_params, "page": page_num, "size": size}
+            page = {}
+            yield from self._stream_search_results(endpoint_name, ipif_type, sps, page)
+            if page.get("failed"):
+                yield {
+                    "IPIF_STATUS": (
+                        "Request failed"
+                        if page_num == 1
+                        else f"Request failed for page {page_num}"
+                    )
+                }
+                return
+
+            number_pages = math.ceil(page["protocol"]["totalHits"] / size)
+            page_num += 1
+
     @_error_if_no_endpoints
     def _iterate_results_from_single_endpoint(
         self, endpoint_name, ipif_type, search_params, statement_params={}
     ):
-        page = 1
-        size = self._DEFAULT_PAGE_REQUEST_SIZE
+        if self._stream:
+            yield from self._iterate_streamed_results(
+                endpoint_name, ipif_type, search_params
+            )
+            return
 
-        sps = {**search_params, "page": page, "size": size}
+        size = self._DEFAULT_PAGE_REQUEST_SIZE
 
-        for _ in range(5):
-            first_response = self._base_query_request(endpoint_name, ipif_type, sps)
-            if first_response:
-                yield from first_response[ipif_type.lower()]
-                break
-            timeout_wrapper(1)
-        else:
+        first_response = self._request_page(
+            endpoint_name, ipif_type, search_params, 1, size
+        )
+        if not first_response:
             yield {"IPIF_STATUS": "Request failed"}
             return
 
+        yield from first_response[ipif_type.lower()]
+
         totalHits = first_response["protocol"]["totalHits"]
         numberPages = math.ceil(totalHits / size)
+        if numberPages < 2:
+            return
 
-        for page_num in range(2, numberPages + 1):
-            sps = {**search_params, "page": page_num, "size": size}
-            for _ in range(5):
-                response = self._base_query_request(endpoint_name, ipif_type, sps)
-                if response:
+        # Now we know how many pages there are, keep up to page_prefetch of them
+        # in flight at once, but still yield them in page order
+        page_numbers = iter(range(2, numberPages + 1))
+        window = max(1, self._page_prefetch)
+
+        with ThreadPoolExecutor(max_workers=window) as executor:
+            pending = deque()
+
+            def fill_window():
+                while len(pending) < window:
+                    page_num = next(page_numbers, None)
+                    if page_num is None:
+                        return
+                    pending.append(
+                        (
+                            page_num,
+                            executor.submit(
+                                self._request_page,
+                                endpoint_name,
+                                ipif_type,
+                                search_params,
+                                page_num,
+                                size,
+                            ),
+                        )
+                    )
+
+            try:
+                fill_window()
+                while pending:
+                    page_num, future = pending.popleft()
+                    response = future.result()
+                    if not response:
+                        yield {"IPIF_STATUS": f"Request failed for page {page_num}"}
+                        return
+
+                    fill_window()
                     yield from response[ipif_type.lower()]
-                    break
-                timeout_wrapper(1)
-            else:
-                yield {"IPIF_STATUS": f"Request failed for page {page_num}"}
-                return
+            finally:
+                # Don't wait on pages nobody is going to read if we stop early
+                for _, future in pending:
+                    future.cancel()
 
     @_error_if_no_endpoints
     def _query_request_from_endpoints(
         self, ipif_type, search_params, statement_params={}
     ):
+        """Gets all the results of a search from every endpoint, the endpoints
+        concurrently. Returns {endpoint_name: [results]}, in endpoint order."""
+
+        def collect(endpoint_name):
+            return list(
+                self._iterate_results_from_single_endpoint(
+                    endpoint_name, ipif_type, search_params, statement_params
+                )
+            )
+
         results = {}
+        with self._progress() as sp:
+            sp.text = f"Searching for {ipif_type} with {str(search_params)}, {str(statement_params)}"
+            for (endpoint_name,), result in self._run_concurrently(
+                collect, [(endpoint_name,) for endpoint_name in self._endpoints]
+            ):
+                results[endpoint_name] = result
+
+        return {
+            endpoint_name: results[endpoint_name]
+            for endpoint_name in self._endpoints
+            if results.get(endpoint_name)
+        }
 
-        with yaspin(Spinners.earth, color="magenta", timer=True) as sp:
+    @_error_if_no_endpoints
+    def _count_results_from_endpoints(self, ipif_type, search_params):
+        """Gets the total number of results for a search from each endpoint,
+        by requesting a single result and reading protocol.totalHits.
+        Returns {endpoint_name: totalHits}, or None for an endpoint that failed."""
+        counts = dict.fromkeys(self._endpoints)
+        for (endpoint_name, _, _, _, _), response in self._run_concurrently(
+            self._request_page,
+            [
+                (endpoint_name, ipif_type, search_params, 1, 1)
+                for endpoint_name in self._endpoints
+            ],
+        ):
+            if response:
+                counts[endpoint_name] = response["protocol"]["totalHits"]
+        return counts
 
-            for endpoint_name in self._endpoints:
-                sp.text = f"Searching for {ipif_type} with {str(search_params)}, {str(statement_params)} from {endpoint_name}"
-                result = list(
-                    self._iterate_results_from_single_endpoint(
-                        endpoint_name, ipif_type, search_params, statement_params
-                    )
+    @_error_if_no_endpoints
+    def _sample_first_pages(self, ipif_type, search_params):
+        """Gets the first page of results for a search from each endpoint,
+        returning {endpoint_name: [results]}"""
+        samples = {}
+        for (endpoint_name, *_), response in self._run_concurrently(
+            self._request_page,
+            [
+                (
+                    endpoint_name,
+                    ipif_type,
+                    search_params,
+                    1,
+                    self._DEFAULT_PAGE_REQUEST_SIZE,
                 )
-                if result:
-                    results[endpoint_name] = result
-
-        return results
+                for endpoint_name in self._endpoints
+            ],
+        ):
+            if response:
+                samples[endpoint_name] = response[ipif_type.lower()]
+        return samples
 
 
 def timeout_wrapper(t):
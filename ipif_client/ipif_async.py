@@ -0,0 +1,694 @@
+import asyncio
+import math
+from contextlib import asynccontextmanager
+
+from ipif_client.exceptions import IPIFClientConfigurationError, IPIFClientDataError
+from ipif_client.ipif import IPIF, _error_if_no_endpoints
+from ipif_client.ipif_queryset import IPIFQuerySet
+from ipif_client.utils.jsonlib import STREAM_CHUNK_SIZE, SearchPageParser
+from ipif_client.utils.singleflight import AsyncSingleFlight
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncIPIFType:
+    """Mixin for IPIFType classes bound to an AsyncIPIF instance, making
+    requests awaitable. Entities are built with the same _init_from_*_json
+    methods as the synchronous classes."""
+
+    __slots__ = ()
+
+    @classmethod
+    async def get_by_id(cls, id_string):
+        """Gets IPIF entity by @id from all endpoints. Combines Persons and Sources to
+        a single entity."""
+
+        resp = await cls._ipif_instance._request_id_from_endpoints(
+            cls.__name__.lower() + "s", id_string
+        )
+        return await cls._from_id_responses(resp, id_string)
+
+    @classmethod
+    def ids(cls, id_strings, as_completed=False):
+        """Gets many IPIF entities by @id at once; see IPIFType.ids. Await the
+        result for a dict, or with as_completed=True, use `async for` to get
+        (id_string, entity) pairs as each entity is ready."""
+        id_strings = list(dict.fromkeys(id_strings))
+        if as_completed:
+            return cls._iter_ids(id_strings)
+        return cls._ids_dict(id_strings)
+
+    @classmethod
+    async def _ids_dict(cls, id_strings):
+        found = {i: entity async for i, entity in cls._iter_ids(id_strings)}
+        return {id_string: found[id_string] for id_string in id_strings}
+
+    @classmethod
+    async def _iter_ids(cls, id_strings):
+        ipif_type = cls.__name__.lower() + "s"
+
+        to_hound = {}
+        responses = cls._ipif_instance._iter_ids_from_endpoints(
+            (ipif_type, id_string) for id_string in id_strings
+        )
+        try:
+            async for (_, id_string), resp in responses:
+                if cls._needs_hound(resp):
+                    to_hound[id_string] = resp
+                else:
+                    yield id_string, cls._build_from_responses(resp, id_string)
+        finally:
+            # Async generators aren't closed when dropped, so close it here
+            # for its pending requests to be cancelled if we stop early
+            await responses.aclose()
+
+        await cls._hound_many(list(to_hound.values()))
+        for id_string, resp in to_hound.items():
+            yield id_string, cls._build_from_responses(resp, id_string)
+
+    @classmethod
+    async def _from_id_responses(cls, resp, id_string):
+        if cls._needs_hound(resp):
+            await cls._hound_alternative_uris(resp)
+        return cls._build_from_responses(resp, id_string)
+
+    @classmethod
+    async def _hound_alternative_uris(cls, resp_dict):
+        await cls._hound_many([resp_dict])
+
+    @classmethod
+    async def _hound_many(cls, resp_dicts):
+        ipif_type = cls.__name__.lower() + "s"
+        searches = [cls._hound_search(resp_dict) for resp_dict in resp_dicts]
+
+        frontier = cls._combined_frontier(searches)
+        while frontier:
+            results = await cls._ipif_instance._gather_bounded(
+                cls._ipif_instance._request_single_object_by_id(
+                    endpoint_name, ipif_type, uri
+                )
+                for _, endpoint_name, uri in frontier
+            )
+            for (search, endpoint_name, uri), resp in zip(frontier, results):
+                search.record(endpoint_name, uri, resp)
+            frontier = cls._combined_frontier(searches)
+
+    async def fetch(self):
+        """Get the full data for a -ref object from the endpoints"""
+        if self._ref_only:
+            new = await self.get_by_id(self.id)
+            if new:
+                self._update_from(new)
+        return self
+
+    def __getattr__(self, name):
+        if name == "label":
+            return self.id
+        if name.startswith("_"):
+            return
+
+        if self._ref_only:
+            raise AttributeError(
+                f"'{name}' is not loaded for {self.__class__.__name__} '{self.id}'; "
+                "await .fetch() first"
+            )
+        raise AttributeError(name)
+
+
+class AsyncIPIFQuerySet(IPIFQuerySet):
+    """QuerySet for an AsyncIPIF instance; iterate with `async for`"""
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        if self._merges_results():
+            data_dict = await self._ipif_instance._query_request_from_endpoints(
+                self._ipif_type, self._search_params
+            )
+            merged = self._merge_results_set(data_dict)
+            entities = [
+                self._entity_class._init_from_id_json(data, endpoint_name=endpoint_name)
+                for endpoint_name, data in merged
+            ]
+            batch_size = self._batch_size()
+            for i in range(0, len(entities), batch_size):
+                batch = entities[i : i + batch_size]
+                for level in self._prefetch_levels(batch):
+                    await self._ipif_instance._hydrate_refs(level)
+                for entity in batch:
+                    yield entity
+            return
+
+        for endpoint_name in self._ipif_instance._endpoints:
+            batch = []
+            async for r in self._ipif_instance._iterate_results_from_single_endpoint(
+                endpoint_name, self._ipif_type, self._search_params
+            ):
+                batch.append(r)
+                if len(batch) >= self._batch_size():
+                    for entity in await self._prefetched(endpoint_name, batch):
+                        yield entity
+                    batch = []
+            for entity in await self._prefetched(endpoint_name, batch):
+                yield entity
+
+    async def _prefetched(self, endpoint_name, results):
+        entities = [
+            entity
+            for batch in self._batches_of_entities(endpoint_name, results)
+            for entity in batch
+        ]
+        for level in self._prefetch_levels(entities):
+            await self._ipif_instance._hydrate_refs(level)
+        return entities
+
+    async def count(self, deduplicate=False):
+        """Number of results, from the totalHits each endpoint reports;
+        see IPIFQuerySet.count"""
+        if self._counts is None:
+            self._counts = await self._ipif_instance._count_results_from_endpoints(
+                self._ipif_type, self._search_params
+            )
+
+        samples = None
+        if deduplicate:
+            samples = await self._ipif_instance._sample_first_pages(
+                self._ipif_type, self._search_params
+            )
+        return self._total_count(deduplicate, samples)
+
+    def __iter__(self):
+        raise TypeError(
+            f"{self.__class__.__name__} belongs to an AsyncIPIF; use 'async for'"
+        )
+
+    async def first(self):
+        results = self.__aiter__()
+        try:
+            async for item in results:
+                return item
+        finally:
+            await results.aclose()
+
+    def __getitem__(self, n):
+        raise TypeError(
+            f"{self.__class__.__name__} belongs to an AsyncIPIF; use 'async for'"
+        )
+
+
+class AsyncIPIF(IPIF):
+    """An IPIF client for use with asyncio. Takes the same config as IPIF.
+
+    Requests are made with aiohttp, so entity lookups are awaited:
+
+        async with AsyncIPIF(config) as ipif:
+            person = await ipif.Persons.id("someId")
+            async for p in ipif.Persons.sourceId("someSourceId"):
+                ...
+    """
+
+    _queryset_base_class = AsyncIPIFQuerySet
+
+    def __init__(self, config={}):
+        if aiohttp is None:
+            raise IPIFClientConfigurationError(
+                "AsyncIPIF requires aiohttp: install ipif-client[async]"
+            )
+        super().__init__(config)
+        self._single_flight = AsyncSingleFlight()
+        # asyncio semaphores enforcing each endpoint's max_in_flight
+        self._in_flight_semaphores = {}
+
+    def _build_entity_class(self, class_name, base_class):
+        return type(
+            class_name,
+            (AsyncIPIFType, base_class),
+            {"_ipif_instance": self, "__slots__": ()},
+        )
+
+    def _build_session(self):
+        # The aiohttp session must be created inside a running event loop,
+        # so is created on first request
+        return None
+
+    def _mount_endpoint(self, uri):
+        pass
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self._pool_size),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """Close any connections held open to the endpoints, and save the
+        identifier index if it has a file"""
+        if self._session is not None:
+            await self._session.close()
+        self._in_flight_semaphores.clear()
+        self.save_identifier_index()
+
+    def __enter__(self):
+        raise TypeError(
+            f"{self.__class__.__name__} is closed asynchronously; use 'async with'"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @_error_if_no_endpoints
+    async def _request_single_object_by_id(self, endpoint_name, ipif_type, id_string):
+        cache_key = (endpoint_name, ipif_type, id_string)
+        return await self._single_flight.do(
+            cache_key, self._fetch_single_object_by_id, cache_key
+        )
+
+    async def _fetch_single_object_by_id(self, cache_key):
+        is_fresh, cached_data, request_headers = self._get_cached_object(cache_key)
+        if is_fresh:
+            return cached_data
+
+        endpoint_name = cache_key[0]
+        URL = self._object_url(*cache_key)
+        resp = await self._get(endpoint_name, URL, headers=request_headers)
+        if resp is None:
+            return self._cache_object_response(cache_key, None, cached_data=cached_data)
+
+        return self._cache_object_response(
+            cache_key,
+            resp.status,
+            (
+                await resp.json(content_type=None, loads=self._loads)
+                if resp.status == 200
+                else None
+            ),
+            headers=resp.headers,
+            cached_data=cached_data,
+        )
+
+    async def _get(self, endpoint_name, URL, stream=False, **kwargs):
+        """GET URL from endpoint_name, within the endpoint's rate limits,
+        retrying as the retry policy allows, without blocking the event loop
+        while waiting. Returns the last response (with its body read, unless
+        stream, when it must be released once read), or None if the connection
+        failed (or timed out), or the endpoint's circuit breaker is open."""
+        health = self._health[endpoint_name]
+        limits = self._limits[endpoint_name]
+        resp = None
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        attempt = 0
+        while True:
+            if not health.allow_request():
+                return resp
+
+            attempt += 1
+            sent = loop.time()
+            try:
+                async with self._in_flight(endpoint_name):
+                    wait = limits.reserve()
+                    if wait:
+                        await asyncio.sleep(wait)
+
+                    sent = loop.time()
+                    try:
+                        resp = await self._get_session().get(URL, **kwargs)
+                        if not stream:
+                            async with resp:
+                                await resp.read()
+                        status, headers = resp.status, resp.headers
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        resp, status, headers = None, None, {}
+            except Exception:
+                # Every request allowed must be recorded, or a half-open
+                # circuit would wait for its probe forever
+                health.record(False, loop.time() - sent)
+                raise
+            except BaseException:
+                # Cancelled, which says nothing about the endpoint
+                health.abandon()
+                raise
+            health.record(status is not None and status < 500, loop.time() - sent)
+
+            if status is not None and status < 400:
+                return resp
+
+            delay = self._retry_policy.next_delay(
+                attempt, status, headers, loop.time() - start
+            )
+            if delay is None:
+                return resp
+            if resp is not None:
+                resp.release()
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def _in_flight(self, endpoint_name):
+        """Hold one of the endpoint's max_in_flight slots, if it has a limit"""
+        max_in_flight = self._limits[endpoint_name].max_in_flight
+        if not max_in_flight:
+            yield
+            return
+
+        if endpoint_name not in self._in_flight_semaphores:
+            self._in_flight_semaphores[endpoint_name] = asyncio.Semaphore(max_in_flight)
+        async with self._in_flight_semaphores[endpoint_name]:
+            yield
+
+    async def _gather_bounded(self, coroutines):
+        """Await coroutines concurrently, at most max_concurrent_requests at once"""
+        semaphore = asyncio.Semaphore(max(1, self._max_concurrent_requests))
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(bounded(c) for c in coroutines))
+
+    @_error_if_no_endpoints
+    async def _request_id_from_endpoints(
+        self, ipif_type, id_string, specify_endpoints=set()
+    ):
+        endpoints_to_get = [
+            endpoint_name
+            for endpoint_name in self._endpoints
+            if not specify_endpoints or endpoint_name in specify_endpoints
+        ]
+        results = await self._gather_bounded(
+            self._request_single_object_by_id(endpoint_name, ipif_type, endpoint_id)
+            for endpoint_name, endpoint_id in self._endpoint_ids(
+                ipif_type, id_string, endpoints_to_get
+            )
+        )
+        return {
+            endpoint_name: result
+            for endpoint_name, result in zip(endpoints_to_get, results)
+            if result
+        }
+
+    @_error_if_no_endpoints
+    async def _iter_ids_from_endpoints(self, type_and_ids):
+        """Async version of IPIF._iter_ids_from_endpoints, yielding
+        ((ipif_type, id_string), {endpoint_name: data}) as each completes"""
+        semaphore = asyncio.Semaphore(max(1, self._max_concurrent_requests))
+
+        async def request(endpoint_name, ipif_type, endpoint_id):
+            async with semaphore:
+                return endpoint_name, await self._request_single_object_by_id(
+                    endpoint_name, ipif_type, endpoint_id
+                )
+
+        async def request_from_endpoints(type_and_id):
+            results = await asyncio.gather(
+                *(
+                    request(endpoint_name, type_and_id[0], endpoint_id)
+                    for endpoint_name, endpoint_id in self._endpoint_ids(
+                        *type_and_id, self._endpoints
+                    )
+                )
+            )
+            return type_and_id, {e: result for e, result in results if result}
+
+        tasks = [
+            asyncio.ensure_future(request_from_endpoints(t))
+            for t in dict.fromkeys(type_and_ids)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Don't make requests nobody is going to read if we stop early
+            for task in tasks:
+                task.cancel()
+
+    @_error_if_no_endpoints
+    async def _request_ids_from_endpoints(self, type_and_ids):
+        type_and_ids = list(dict.fromkeys(type_and_ids))
+        found = {
+            t: resp async for t, resp in self._iter_ids_from_endpoints(type_and_ids)
+        }
+        return {type_and_id: found[type_and_id] for type_and_id in type_and_ids}
+
+    async def _hydrate_refs(self, objects):
+        refs = self._refs_to_hydrate(objects)
+        if not refs:
+            return
+
+        responses = await self._request_ids_from_endpoints(
+            (cls.__name__.lower() + "s", id_string) for cls, id_string in refs
+        )
+        for (cls, id_string), ref_objects in refs.items():
+            try:
+                new = await cls._from_id_responses(
+                    responses[(cls.__name__.lower() + "s", id_string)], id_string
+                )
+            except IPIFClientDataError:
+                continue
+            if new:
+                for obj in ref_objects:
+                    obj._update_from(new)
+
+    async def hydrate(self, objects, depth=1):
+        """Fetch the full data of -ref objects in bulk; see IPIF.hydrate"""
+        level = [objects] if hasattr(objects, "_ref_only") else list(objects)
+        seen = {id(obj) for obj in level}
+
+        for _ in range(depth + 1):
+            if not level:
+                break
+            await self._hydrate_refs(level)
+            level = self._next_hydration_level(level, seen)
+
+        return objects
+
+    @_error_if_no_endpoints
+    async def _base_query_request(
+        self, endpoint_name, ipif_type, search_params, statement_params={}
+    ):
+        cache_key = self._search_cache_key(endpoint_name, ipif_type, search_params)
+        return await self._single_flight.do(
+            cache_key,
+            self._fetch_search_results,
+            endpoint_name,
+            ipif_type,
+            search_params,
+            cache_key,
+        )
+
+    async def _fetch_search_results(
+        self, endpoint_name, ipif_type, search_params, cache_key
+    ):
+        is_cached, data = self._data_cache.lookup(cache_key)
+        if is_cached:
+            return data
+
+        URL = self._search_url(endpoint_name, ipif_type)
+        resp = await self._get(
+            endpoint_name, URL, params={k: str(v) for k, v in search_params.items()}
+        )
+        if resp is None or resp.status != 200:
+            return None
+
+        data = await resp.json(content_type=None, loads=self._loads)
+        self._data_cache.set(cache_key, data)
+        self._learn_identifiers(
+            endpoint_name, ipif_type, data.get(ipif_type.lower(), [])
+        )
+        return data
+
+    async def _request_page(self, endpoint_name, ipif_type, search_params, page, size):
+        sps = {**search_params, "page": page, "size": size}
+        return await self._base_query_request(endpoint_name, ipif_type, sps) or None
+
+    async def _stream_search_results(
+        self, endpoint_name, ipif_type, search_params, page
+    ):
+        results_key = ipif_type.lower()
+        cache_key = self._search_cache_key(endpoint_name, ipif_type, search_params)
+        is_cached, data = self._data_cache.lookup(cache_key)
+        if is_cached:
+            for result in data[results_key]:
+                yield result
+            page["protocol"] = data["protocol"]
+            return
+
+        URL = self._search_url(endpoint_name, ipif_type)
+        resp = await self._get(
+            endpoint_name,
+            URL,
+            stream=True,
+            params={k: str(v) for k, v in search_params.items()},
+        )
+        if resp is None:
+            page["failed"] = True
+            return
+
+        parser = SearchPageParser(results_key, self._loads)
+        results = []
+        async with resp:
+            if resp.status != 200:
+                page["failed"] = True
+                return
+            try:
+                async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    for result in parser.feed(chunk):
+                        results.append(result)
+                        yield result
+                remaining = parser.close()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                page["failed"] = True
+                return
+        results += remaining
+        for result in remaining:
+            yield result
+
+        page["protocol"] = parser.protocol
+        self._data_cache.set(
+            cache_key, {"protocol": parser.protocol, results_key: results}
+        )
+        self._learn_identifiers(endpoint_name, ipif_type, results)
+
+    async def _iterate_streamed_results(self, endpoint_name, ipif_type, search_params):
+        size = self._DEFAULT_PAGE_REQUEST_SIZE
+        page_num, number_pages = 1, 1
+        while page_num <= number_pages:
+            sps = {**search_params, "page": page_num, "size": size}
+            page = {}
+            async for result in self._stream_search_results(
+                endpoint_name, ipif_type, sps, page
+            ):
+                yield result
+            if page.get("failed"):
+                yield {
+                    "IPIF_STATUS": (
+                        "Request failed"
+                        if page_num == 1
+                        else f"Request failed for page {page_num}"
+                    )
+                }
+                return
+
+            number_pages = math.ceil(page["protocol"]["totalHits"] / size)
+            page_num += 1
+
+    @_error_if_no_endpoints
+    async def _iterate_results_from_single_endpoint(
+        self, endpoint_name, ipif_type, search_params, statement_params={}
+    ):
+        if self._stream:
+            async for result in self._iterate_streamed_results(
+                endpoint_name, ipif_type, search_params
+            ):
+                yield result
+            return
+
+        size = self._DEFAULT_PAGE_REQUEST_SIZE
+
+        first_response = await self._request_page(
+            endpoint_name, ipif_type, search_params, 1, size
+        )
+        if not first_response:
+            yield {"IPIF_STATUS": "Request failed"}
+            return
+
+        for item in first_response[ipif_type.lower()]:
+            yield item
+
+        totalHits = first_response["protocol"]["totalHits"]
+        numberPages = math.ceil(totalHits / size)
+
+        page_numbers = iter(range(2, numberPages + 1))
+        window = max(1, self._page_prefetch)
+        pending = []
+
+        def fill_window():
+            while len(pending) < window:
+                page_num = next(page_numbers, None)
+                if page_num is None:
+                    return
+                pending.append(
+                    (
+                        page_num,
+                        asyncio.ensure_future(
+                            self._request_page(
+                                endpoint_name, ipif_type, search_params, page_num, size
+                            )
+                        ),
+                    )
+                )
+
+        try:
+            fill_window()
+            while pending:
+                page_num, task = pending.pop(0)
+                response = await task
+                if not response:
+                    yield {"IPIF_STATUS": f"Request failed for page {page_num}"}
+                    return
+
+                fill_window()
+                for item in response[ipif_type.lower()]:
+                    yield item
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    @_error_if_no_endpoints
+    async def _query_request_from_endpoints(
+        self, ipif_type, search_params, statement_params={}
+    ):
+        async def collect(endpoint_name):
+            return [
+                item
+                async for item in self._iterate_results_from_single_endpoint(
+                    endpoint_name, ipif_type, search_params, statement_params
+                )
+            ]
+
+        endpoint_names = list(self._endpoints)
+        results = await self._gather_bounded(collect(e) for e in endpoint_names)
+        return {
+            endpoint_name: result
+            for endpoint_name, result in zip(endpoint_names, results)
+            if result
+        }
+
+    @_error_if_no_endpoints
+    async def _count_results_from_endpoints(self, ipif_type, search_params):
+        endpoint_names = list(self._endpoints)
+        responses = await self._gather_bounded(
+            self._request_page(endpoint_name, ipif_type, search_params, 1, 1)
+            for endpoint_name in endpoint_names
+        )
+        return {
+            endpoint_name: response["protocol"]["totalHits"] if response else None
+            for endpoint_name, response in zip(endpoint_names, responses)
+        }
+
+    @_error_if_no_endpoints
+    async def _sample_first_pages(self, ipif_type, search_params):
+        endpoint_names = list(self._endpoints)
+        responses = await self._gather_bounded(
+            self._request_page(
+                endpoint_name,
+                ipif_type,
+                search_params,
+                1,
+                self._DEFAULT_PAGE_REQUEST_SIZE,
+            )
+            for endpoint_name in endpoint_names
+        )
+        return {
+            endpoint_name: response[ipif_type.lower()]
+            for endpoint_name, response in zip(endpoint_names, responses)
+            if response
+        }
@@ -1,16 +1,49 @@
 from functools import wraps
 
-
-from dateutil.parser import *
-
 from ipif_client.exceptions import IPIFClientConfigurationError, IPIFClientDataError
 from ipif_client.ipif_queryset import IPIFQuerySet
 from ipif_client.utils.bunch import Bunch
+from ipif_client.utils.dates import parse_datetime
+from ipif_client.utils.hound import HoundSearch
+from ipif_client.utils.reconcile import merge_entity_dicts
 from ipif_client.utils.statements_container import Statements
 
 
+class _EntityId:
+    """The id of an entity, which on the class is instead the method to get
+    an entity by its @id: ipif.Persons.id("someId").id == "ENDPOINT::someId"
+    """
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return objtype.get_by_id
+        try:
+            return obj._id
+        except AttributeError:
+            raise AttributeError("id") from None
+
+    def __set__(self, obj, value):
+        obj._id = value
+
+
 class IPIFType:
-    _ref_only = False
+    # Entities are slotted, without a __dict__, as there can be a great many
+    # of them. Subclasses (including those built for each IPIF instance) must
+    # define __slots__ too, even if empty.
+    __slots__ = (
+        "_ref_only",
+        "_data_dict",
+        "_id",
+        "local_id",
+        "label",
+        "uris",
+        "createdBy",
+        "createdWhen",
+        "modifiedBy",
+        "modifiedWhen",
+        "factoids",
+        "__weakref__",
+    )
 
     def _proxy_to_new_queryset(method_name):
         """Define a method on IPIFType that creates a new QuerySet
@@ -45,6 +78,10 @@ class IPIFType:
         return self.__str__()
 
     def __getitem__(self, name):
+        if self._data_dict is None:
+            raise KeyError(
+                f"{name}: the raw data of {self} was not kept (keep_data_dict is False)"
+            )
         return self._data_dict.get(name)
 
     @classmethod
@@ -78,81 +115,210 @@ class IPIFType:
         return start_endpoint_name, start_dict
 
     @classmethod
-    def _reconcile_persons_from_id(cls, resp_dict):
-        start_endpoint_name, start_dict = cls._select_start_endpoint_and_dict(resp_dict)
+    def _hound_search(cls, resp_dict):
+        ipif = cls._ipif_instance
+        return HoundSearch(
+            resp_dict,
+            ipif._endpoints,
+            max_depth=ipif._hound_max_depth,
+            max_requests=ipif._hound_max_requests,
+            identifier_index=ipif._identifier_index,
+            ipif_type=cls.__name__.lower() + "s",
+        )
+
+    @classmethod
+    def _hound_alternative_uris(cls, resp_dict):
+        """Try endpoints that have returned None (or failed... again; why not?)
+        with all the other URIs available for this entity, to see if we
+        have any luck with an alternative URI. Each round of URIs is
+        requested concurrently."""
+        cls._hound_many([resp_dict])
+
+    @staticmethod
+    def _combined_frontier(searches):
+        """The next round of requests for several hound searches, as
+        (search, endpoint_name, uri)"""
+        return [
+            (search, endpoint_name, uri)
+            for search in searches
+            for endpoint_name, uri in search.next_frontier()
+        ]
+
+    @classmethod
+    def _hound_many(cls, resp_dicts):
+        """Hound mode for several entities at once: each round of requests
+        for all of them goes through one concurrent pool"""
+        ipif_type = cls.__name__.lower() + "s"
+        searches = [cls._hound_search(resp_dict) for resp_dict in resp_dicts]
+
+        frontier = cls._combined_frontier(searches)
+        while frontier:
+            # The same request might be wanted by more than one search
+            waiting = {}
+            for search, endpoint_name, uri in frontier:
+                waiting.setdefault((endpoint_name, ipif_type, uri), []).append(search)
+
+            for request, resp in cls._ipif_instance._run_concurrently(
+                cls._ipif_instance._request_single_object_by_id, list(waiting)
+            ):
+                for search in waiting[request]:
+                    search.record(request[0], request[2], resp)
+            frontier = cls._combined_frontier(searches)
+
+    @classmethod
+    def _needs_hound(cls, resp):
+        """Whether hound mode should look for this entity on other endpoints"""
+        return (
+            cls.__name__ not in ("Statement", "Factoid")
+            and cls._ipif_instance._hound_mode
+            and cls._select_start_endpoint_and_dict(resp)[1] is not None
+            and bool(cls._hound_search(resp).unresolved_endpoints())
+        )
+
+    @classmethod
+    def _merge_reconciled(cls, start_endpoint_name, start_dict, resp_dict):
+        """Merge factoid-refs and uris from every endpoint's data into a copy of
+        start_dict, tagging each factoid-ref with the endpoint it came from.
+
+        The endpoints' @ids are recorded as equivalent in the identifier index,
+        so next time the entity can be requested from each directly."""
+        items = [(start_endpoint_name, start_dict)] + [
+            (endpoint_name, data)
+            for endpoint_name, data in resp_dict.items()
+            if data
+            and data != {"IPIF_STATUS": "Request failed"}
+            and endpoint_name != start_endpoint_name
+        ]
+        cls._ipif_instance._identifier_index.learn_equivalents(
+            cls.__name__.lower() + "s", items
+        )
+        return start_endpoint_name, merge_entity_dicts(items)
+
+    @classmethod
+    def _from_endpoint_specific_responses(cls, resp, id_string):
+        """Statements and Factoids are unique to their endpoint, so are
+        not reconciled: return the one found, or complain if there are more."""
+        items = [
+            (endpoint_name, data)
+            for endpoint_name, data in resp.items()
+            if data and data != {"IPIF_STATUS": "Request failed"}
+        ]
+        if not items:
+            return None
+        if len(items) == 1:
+            endpoint_name, data = items[0]
+            return cls._init_from_id_json(data, endpoint_name=endpoint_name)
+        if len(items) > 1:
+            raise IPIFClientDataError(
+                f"More than one {cls.__name__} with id '{id_string}' was found."
+                "Try selecting from a specific endpoint with [MECHANISM NOT YET INVENTED]"
+            )
+
+    @classmethod
+    def _from_id_responses(cls, resp, id_string):
+        """Build an entity from the {endpoint_name: data} responses to
+        a request for id_string"""
+
+        # Don't just return the first one here... RECONCILE!
+        if cls._needs_hound(resp):
+            cls._hound_alternative_uris(resp)
+        return cls._build_from_responses(resp, id_string)
+
+    @classmethod
+    def _build_from_responses(cls, resp, id_string):
+        """Build an entity from the {endpoint_name: data} responses to
+        a request for id_string, once any hounding has been done"""
+        if cls.__name__ in ("Statement", "Factoid"):
+            return cls._from_endpoint_specific_responses(resp, id_string)
+
+        start_endpoint_name, start_dict = cls._select_start_endpoint_and_dict(resp)
         if start_dict is None:
-            return None, None
-
-        if cls._ipif_instance._hound_mode:
-
-            # Here, we get a list of all the other URIs available for this entity
-            # and try endpoints that have returned None (or failed... again; why not?)
-            # to see if we have any luck with this alternative URI
-            alternative_uris_to_try = []
-            for data in resp_dict.values():
-                if data and data != {"IPIF_STATUS": "Request failed"}:
-                    alternative_uris_to_try += data.get("uris", [])
-
-            for endpoint_name, data in resp_dict.items():
-                if not data or data == {"IPIF_STATUS": "Request failed"}:
-                    # endpoint_name, ipif_type, id_string
-                    for uri in alternative_uris_to_try:
-                        resp = cls._ipif_instance._request_single_object_by_id(
-                            endpoint_name, cls.__name__.lower() + "s", uri
-                        )
-                        if resp and resp != {"IPIF_STATUS": "Request failed"}:
-                            resp_dict[endpoint_name] = resp
-
-        # print(start_dict)
-        for factoid in start_dict["factoid-refs"]:
-            factoid["ipif-endpoint"] = start_endpoint_name
-
-        for endpoint_name, data in resp_dict.items():
-            if data.get("factoid-refs", None) and endpoint_name != start_endpoint_name:
-                for factoid in data["factoid-refs"]:
-                    factoid["ipif-endpoint"] = endpoint_name
-                    start_dict["factoid-refs"].append(factoid)
-                start_dict["uris"] = list(set([*start_dict["uris"], *data["uris"]]))
+            return None
+        endpoint_name, data = cls._merge_reconciled(
+            start_endpoint_name, start_dict, resp
+        )
+        return cls._init_from_id_json(data, endpoint_name=endpoint_name)
 
-        return start_endpoint_name, start_dict
+    id = _EntityId()
 
     @classmethod
-    def id(cls, id_string):
+    def get_by_id(cls, id_string):
         """Gets IPIF entity by @id from all endpoints. Combines Persons and Sources to
-        a single entity."""
-
-        #### HERE... move all the requesting logic here... oh no... the
-        ## request_id_from_endpoints needs to do all the grabbing of shit
+        a single entity. (Also called as Persons.id(id_string), etc.)"""
 
         resp = cls._ipif_instance._request_id_from_endpoints(
             cls.__name__.lower() + "s", id_string
         )
+        return cls._from_id_responses(resp, id_string)
 
-        # Don't just return the first one here... RECONCILE!
-        if cls.__name__ in ("Statement", "Factoid"):
-            items = [
-                (endpoint_name, data)
-                for endpoint_name, data in resp.items()
-                if data and data != {"IPIF_STATUS": "Request failed"}
-            ]
-            if not items:
-                return None
-            if len(items) == 1:
-                endpoint_name, data = items[0]
-                return cls._init_from_id_json(data, endpoint_name=endpoint_name)
-            if len(items) > 1:
-                raise IPIFClientDataError(
-                    f"More than one {cls.__name__} with id '{id_string}' was found."
-                    "Try selecting from a specific endpoint with [MECHANISM NOT YET INVENTED]"
-                )
-        else:
-            endpoint_name, data = cls._reconcile_persons_from_id(resp)
-            if not data:
-                return None
-            return cls._init_from_id_json(
-                data,
-                endpoint_name=endpoint_name,
-            )
+    @classmethod
+    def _slot_names(cls):
+        return [
+            name
+            for klass in cls.__mro__
+            for name in klass.__dict__.get("__slots__", ())
+            if name != "__weakref__"
+        ]
+
+    def _loaded(self, name):
+        """The value of attribute name, or None if it is not set (without
+        fetching a -ref)"""
+        try:
+            return object.__getattribute__(self, name)
+        except AttributeError:
+            return None
+
+    @classmethod
+    def ids(cls, id_strings, as_completed=False):
+        """Gets many IPIF entities by @id at once. Every request, to every
+        endpoint, goes through one bounded pool, and hound mode is run for
+        the whole batch together. Duplicate ids are only requested once.
+
+        Returns {id_string: entity, or None if not found}, in the order given;
+        or with as_completed=True, yields (id_string, entity) pairs as each
+        entity is ready."""
+        id_strings = list(dict.fromkeys(id_strings))
+        if as_completed:
+            return cls._iter_ids(id_strings)
+        found = dict(cls._iter_ids(id_strings))
+        return {id_string: found[id_string] for id_string in id_strings}
+
+    @classmethod
+    def _iter_ids(cls, id_strings):
+        ipif_type = cls.__name__.lower() + "s"
+
+        # Entities are ready as soon as all endpoints have responded, unless
+        # hound mode needs to look further, which is done for them all at the end
+        to_hound = {}
+        for (_, id_string), resp in cls._ipif_instance._iter_ids_from_endpoints(
+            (ipif_type, id_string) for id_string in id_strings
+        ):
+            if cls._needs_hound(resp):
+                to_hound[id_string] = resp
+            else:
+                yield id_string, cls._build_from_responses(resp, id_string)
+
+        cls._hound_many(list(to_hound.values()))
+        for id_string, resp in to_hound.items():
+            yield id_string, cls._build_from_responses(resp, id_string)
+
+    def _update_from(self, other):
+        """Fill in this (-ref) object with the data of a full object"""
+        for name in other._slot_names():
+            try:
+                setattr(self, name, object.__getattribute__(other, name))
+            except AttributeError:
+                pass
+
+    def _related_objects(self):
+        """The IPIF entities this one refers to, as far as they are loaded
+        (does not trigger fetching a -ref)"""
+        related = list(self._loaded("factoids") or [])
+        for name in ("source", "person"):
+            if self._loaded(name) is not None:
+                related.append(self._loaded(name))
+        related += list(self._loaded("statements") or [])
+        return related
 
     def __getattr__(self, name):
         """If an IPIFType is a -ref, i.e. not full data,
@@ -174,7 +340,7 @@ class IPIFType:
 
             if new:
                 return_value = getattr(new, name)
-                self.__dict__.update(new.__dict__)
+                self._update_from(new)
 
                 if return_value:
                     return return_value
@@ -191,7 +357,6 @@ class IPIFType:
         o = cls()
         o._ref_only = False  # if full object, not just ref_only
 
-        o.get_by_id = cls.id
         o.id = f"{endpoint_name}::{r['@id']}"
 
         o.local_id = r["@id"]
@@ -199,73 +364,110 @@ class IPIFType:
         o.uris = r.get("uris", [])
         o.createdBy = r.get("createdBy", "")
         o.createdWhen = (
-            parse(r["createdWhen"].replace("Z", "")) if "createdWhen" in r else None
+            parse_datetime(r["createdWhen"].replace("Z", ""))
+            if "createdWhen" in r
+            else None
         )
 
         o.modifiedBy = r.get("modifiedBy", "")
         o.modifiedWhen = (
-            parse(r["modifiedWhen"].replace("Z", "")) if "modifiedWhen" in r else None
+            parse_datetime(r["modifiedWhen"].replace("Z", ""))
+            if "modifiedWhen" in r
+            else None
         )
 
         if cls.__name__ != "Factoid":
             o.factoids = [
-                cls._ipif_instance.Factoids._init_from_ref_json(f_json)
+                cls._ipif_instance.Factoids._init_from_ref_json(f_json, endpoint_name)
                 for f_json in r.get("factoid-refs", [])
             ]
 
-        o._data_dict = r
+        # The raw data can be dropped to save memory, at the cost of item access
+        o._data_dict = r if cls._ipif_instance._keep_data_dict else None
 
         return o
 
     @classmethod
-    def _init_from_ref_json(cls, r):
+    def _init_from_ref_json(cls, r, endpoint_name=None):
+        """Get the -ref object for r, from endpoint_name (or the endpoint
+        it is tagged with, if merged from several).
+
+        Each -ref is only built once per IPIF instance (for as long as it is
+        in use), so all references to the same entity share one object, and
+        fetching its data for one fetches it for all."""
+        endpoint_name = r.get("ipif-endpoint", endpoint_name)
+        key = (cls.__name__, endpoint_name, r["@id"])
+        identity_map = cls._ipif_instance._identity_map
+
+        o = identity_map.get(key)
+        if o is None:
+            o = identity_map.setdefault(key, cls._new_ref(r, endpoint_name))
+        return o
+
+    @classmethod
+    def _new_ref(cls, r, endpoint_name):
         o = cls()
         o._ref_only = True  # Initted as X-ref only
+        o._data_dict = None
 
-        o.get_by_id = cls.id
         o.id = r["@id"]
 
         return o
 
 
 class IPIFFactoids(IPIFType):
+    __slots__ = ("source", "person", "statements")
+
     @classmethod
     def _init_from_id_json(cls, r, endpoint_name):
         o = super()._init_from_id_json(r, endpoint_name=endpoint_name)
-        o.source = cls._ipif_instance.Sources._init_from_ref_json(r.get("source-ref"))
-        o.person = cls._ipif_instance.Persons._init_from_ref_json(r.get("person-ref"))
-        o.statements = Statements(
-            (
-                cls._ipif_instance.Statements._init_from_ref_json(st_json)
-                for st_json in r.get("statement-refs", [])
-            )
-        )
+        cls._init_refs(o, r, endpoint_name)
         return o
 
     @classmethod
-    def _init_from_ref_json(cls, r):
+    def _new_ref(cls, r, endpoint_name):
+        # A factoid-ref carries its source, person and statement -refs, but
+        # the rest of the factoid is still to be fetched
         o = cls()
+        o._ref_only = True
+        o._data_dict = None
         o.id = r["@id"]
-        o.source = cls._ipif_instance.Sources._init_from_ref_json(r.get("source-ref"))
-        o.person = cls._ipif_instance.Persons._init_from_ref_json(r.get("person-ref"))
+        cls._init_refs(o, r, endpoint_name)
+        return o
+
+    @classmethod
+    def _init_refs(cls, o, r, endpoint_name):
+        ipif = cls._ipif_instance
+        o.source = ipif.Sources._init_from_ref_json(r.get("source-ref"), endpoint_name)
+        o.person = ipif.Persons._init_from_ref_json(r.get("person-ref"), endpoint_name)
         o.statements = Statements(
             (
-                cls._ipif_instance.Statements._init_from_ref_json(st_json)
+                ipif.Statements._init_from_ref_json(st_json, endpoint_name)
                 for st_json in r.get("statement-refs", [])
             )
         )
-        return o
 
 
 class IPIFPersons(IPIFType):
-    pass
+    __slots__ = ()
 
 
 class IPIFSources(IPIFType):
-    pass
+    __slots__ = ()
 
 
 class IPIFStatements(IPIFType):
+    __slots__ = (
+        "statementType",
+        "name",
+        "memberOf",
+        "role",
+        "date",
+        "statementText",
+        "places",
+        "relatesToPersons",
+    )
+
     @classmethod
     def _init_from_id_json(cls, r, endpoint_name):
         # print(r)
@@ -277,7 +479,9 @@ class IPIFStatements(IPIFType):
 
         date = r.get("date", {})
         sortdate = date.get("sortdate", None)
-        parsed_sortdate = parse(sortdate).replace(tzinfo=None) if sortdate else None
+        parsed_sortdate = (
+            parse_datetime(sortdate).replace(tzinfo=None) if sortdate else None
+        )
         date_label = date.get("label")
 
         o.date = Bunch("Date", {"sortdate": parsed_sortdate, "label": date_label})
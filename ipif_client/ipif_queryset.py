@@ -1,10 +1,21 @@
+from contextlib import closing
+from itertools import islice
+
 from .exceptions import IPIFClientQueryError
+from .utils.reconcile import merge_entities
+
+# Attributes of IPIF entities that refer to other entities, which can be prefetched
+PREFETCHABLE_ATTRIBUTES = ("factoids", "statements", "source", "person")
 
 
 class IPIFQuerySet:
-    def __init__(self, search_params=None, *args, **kwargs):
+    def __init__(
+        self, search_params=None, prefetch_paths=(), reconcile=False, *args, **kwargs
+    ):
         self._search_params = search_params or {}
-        self._data = []
+        self._prefetch_paths = tuple(prefetch_paths)
+        self._reconcile = reconcile
+        self._counts = None
 
     def _spawn_new_with_search_param(param: str):
         """Takes name of a parameter and returns function
@@ -20,7 +31,9 @@ class IPIFQuerySet:
                 search_params={
                     **self._search_params,
                     param: value,
-                }
+                },
+                prefetch_paths=self._prefetch_paths,
+                reconcile=self._reconcile,
             )
 
         return inner_func
@@ -34,45 +47,202 @@ class IPIFQuerySet:
     personId = _spawn_new_with_search_param("personId")
     p = _spawn_new_with_search_param("p")
 
-    @staticmethod
-    def _merge_results_set(data_dict):
-        pass
-
-    @staticmethod
-    def _trivially_merge(data_dict):
-        ## UNDERACHIEVERS MUST TRY HARDER
-
-        results_list = []
-        for endpoint_name, result_list in data_dict.items():
-            print(result_list)
-            results_list += result_list
-
-        return results_list
-
-    def _with_data(func):
-        """Method decorator to get data as required before
-        calling the desired function."""
-
-        def inner(self, *args, **kwargs):
-            if not self._data:
-                self._data = self._trivially_merge(
-                    self._ipif_instance._query_request_from_endpoints(
-                        "PERSONS", self._search_params
+    def prefetch(self, *paths):
+        """Returns a new queryset which, when its results are fetched, also
+        fetches the entities they refer to along each of paths, e.g.
+        .prefetch("factoids.statements", "factoids.source"). All the refs at
+        each level are fetched together, each distinct one once."""
+        for path in paths:
+            for attribute in path.split("."):
+                if attribute not in PREFETCHABLE_ATTRIBUTES:
+                    raise IPIFClientQueryError(
+                        f"Cannot prefetch '{path}': '{attribute}' is not one of "
+                        f"{', '.join(PREFETCHABLE_ATTRIBUTES)}"
                     )
-                )
-            return func(self, *args, **kwargs)
 
-        return inner
+        return self.__class__(
+            search_params=self._search_params,
+            prefetch_paths=tuple(dict.fromkeys(self._prefetch_paths + paths)),
+            reconcile=self._reconcile,
+        )
+
+    def reconcile(self, reconcile=True):
+        """Returns a new queryset which merges Persons and Sources from
+        different endpoints that share a URI into one entity, with all their
+        factoid-refs. This needs all the results from every endpoint (fetched
+        concurrently) before any can be returned, so is off by default."""
+        return self.__class__(
+            search_params=self._search_params,
+            prefetch_paths=self._prefetch_paths,
+            reconcile=reconcile,
+        )
+
+    def _prefetch_levels(self, results):
+        """Yields, level by level, lists of the objects found along the prefetch
+        paths from results that need hydrating. Each level must be hydrated
+        before the next is asked for, as refs only have their related objects
+        once loaded. Objects part way along a path are only included if they
+        do not have the next attribute yet (factoid-refs, for example, already
+        have their source, person and statements)."""
+        final_paths = {tuple(path.split(".")) for path in self._prefetch_paths}
+        paths = set()
+        for attributes in final_paths:
+            # Include each prefix of the path too, e.g. factoids for factoids.source
+            for i in range(1, len(attributes) + 1):
+                paths.add(attributes[:i])
+
+        objects_at_path = {(): list(results)}
+        for depth in range(1, max((len(p) for p in paths), default=0) + 1):
+            level = []
+            for path in sorted(p for p in paths if len(p) == depth):
+                objects = []
+                for parent in objects_at_path[path[:-1]]:
+                    value = parent._loaded(path[-1])
+                    if isinstance(value, list):
+                        objects += value
+                    elif value is not None:
+                        objects.append(value)
+                objects_at_path[path] = objects
+
+                if path in final_paths:
+                    level += objects
+                    continue
+                next_attributes = {
+                    p[depth] for p in paths if len(p) > depth and p[:depth] == path
+                }
+                level += [
+                    obj
+                    for obj in objects
+                    if any(obj._loaded(a) is None for a in next_attributes)
+                ]
+            yield level
+
+    def _batch_size(self):
+        """Number of results to build before any are yielded: a page if
+        prefetching, so each batch's refs can be fetched together, otherwise
+        one, so each result is yielded as soon as it arrives"""
+        if self._prefetch_paths:
+            return self._ipif_instance._DEFAULT_PAGE_REQUEST_SIZE
+        return 1
+
+    def _batches_of_entities(self, endpoint_name, results):
+        """Build IPIF entities from an endpoint's search results, in batches
+        (see _batch_size) that can each be prefetched together"""
+        batch_size = self._batch_size()
+        batch = []
+        for r in results:
+            if "IPIF_STATUS" in r:
+                continue
+            batch.append(
+                self._entity_class._init_from_id_json(r, endpoint_name=endpoint_name)
+            )
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _estimate_unique_fraction(self, samples):
+        """From samples of results from several endpoints, estimate the fraction
+        that are distinct entities once reconciled"""
+        sample_size = sum(len(results) for results in samples.values())
+        if not sample_size:
+            return 1
+        return len(self._merge_results_set(samples)) / sample_size
+
+    def _total_count(self, deduplicate, samples=None):
+        total = sum(c for c in self._counts.values() if c)
+        if not deduplicate or len([c for c in self._counts.values() if c]) < 2:
+            return total
+        return round(total * self._estimate_unique_fraction(samples))
+
+    def count(self, deduplicate=False):
+        """Number of results, from the totalHits each endpoint reports for a
+        single-result request, without fetching the results themselves.
+
+        Results from different endpoints may be the same entity: with
+        deduplicate=True, the first page from each endpoint is fetched and the
+        proportion of duplicates in it used to estimate the distinct count."""
+        if self._counts is None:
+            self._counts = self._ipif_instance._count_results_from_endpoints(
+                self._ipif_type, self._search_params
+            )
+
+        samples = None
+        if deduplicate:
+            samples = self._ipif_instance._sample_first_pages(
+                self._ipif_type, self._search_params
+            )
+        return self._total_count(deduplicate, samples)
+
+    @property
+    def _ipif_type(self):
+        """The IPIF type name searched by this queryset, e.g. 'Persons'"""
+        return self.__class__.__name__.replace("QuerySet", "")
+
+    def _merge_results_set(self, data_dict):
+        """Reconcile {endpoint_name: [results]} into a list of
+        (endpoint_name, merged_data), one for each distinct entity"""
+        return merge_entities(
+            data_dict, preferred_endpoint=self._ipif_instance._preferred_endpoint
+        )
+
+    def _merges_results(self):
+        """Persons and Sources from different endpoints are reconciled if asked
+        for, which needs all the results; otherwise results are streamed"""
+        return (
+            self._reconcile
+            and self._ipif_type in ("Persons", "Sources")
+            and len(self._ipif_instance._endpoints) > 1
+        )
+
+    def _merged_batches_of_entities(self):
+        data_dict = self._ipif_instance._query_request_from_endpoints(
+            self._ipif_type, self._search_params
+        )
+        merged = self._merge_results_set(data_dict)
+        batch_size = self._batch_size()
+        for i in range(0, len(merged), batch_size):
+            yield [
+                self._entity_class._init_from_id_json(data, endpoint_name=endpoint_name)
+                for endpoint_name, data in merged[i : i + batch_size]
+            ]
+
+    def _all_batches_of_entities(self):
+        if self._merges_results():
+            yield from self._merged_batches_of_entities()
+            return
+
+        for endpoint_name in self._ipif_instance._endpoints:
+            results = self._ipif_instance._iterate_results_from_single_endpoint(
+                endpoint_name, self._ipif_type, self._search_params
+            )
+            yield from self._batches_of_entities(endpoint_name, results)
 
-    @_with_data
     def __iter__(self):
-        yield from self._data
+        """Streams results from each endpoint in turn (a page at a time if
+        prefetching), so only the pages needed are requested and the whole
+        result set is never held (unless results are reconciled across
+        endpoints)"""
+        for batch in self._all_batches_of_entities():
+            for level in self._prefetch_levels(batch):
+                self._ipif_instance._hydrate_refs(level)
+            yield from batch
 
-    @_with_data
     def first(self):
-        pass
+        with closing(iter(self)) as results:
+            return next(results, None)
 
-    @_with_data
     def __getitem__(self, n):
-
-        return self._data[n]
+        if isinstance(n, slice):
+            if any(i is not None and i < 0 for i in (n.start, n.stop, n.step)):
+                return list(self)[n]
+            with closing(iter(self)) as results:
+                return list(islice(results, n.start, n.stop, n.step))
+
+        if n < 0:
+            return list(self)[n]
+        with closing(iter(self)) as results:
+            for item in islice(results, n, n + 1):
+                return item
+        raise IndexError("IPIFQuerySet index out of range")
@@ -0,0 +1,69 @@
+import sys
+
+
+class NullProgress:
+    """Progress reporter that shows nothing. Progress reporters are context
+    managers, used around a batch of requests: set text to say what is
+    going on, and write() a line for each thing done."""
+
+    def __init__(self, text=""):
+        self.text = text
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write(self, message):
+        pass
+
+
+class SpinnerProgress:
+    """Progress reporter showing a yaspin spinner (with a timer) in the
+    terminal. yaspin is only imported when a spinner is started."""
+
+    def __init__(self, text=""):
+        from yaspin import yaspin
+        from yaspin.spinners import Spinners
+
+        self._spinner = yaspin(Spinners.earth, color="magenta", timer=True, text=text)
+
+    @property
+    def text(self):
+        return self._spinner.text
+
+    @text.setter
+    def text(self, value):
+        self._spinner.text = value
+
+    def __enter__(self):
+        self._spinner.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._spinner.stop()
+        return False
+
+    def write(self, message):
+        self._spinner.write(message)
+
+
+def auto_progress(text=""):
+    """A spinner if running in a terminal, otherwise nothing"""
+    if sys.stdout is not None and sys.stdout.isatty():
+        return SpinnerProgress(text)
+    return NullProgress(text)
+
+
+def progress_factory(option):
+    """The progress reporter factory for the "progress" config option: "auto"
+    (a spinner only in a terminal), True (always a spinner), False (nothing),
+    or a callable taking the initial text and returning a progress reporter"""
+    if option == "auto":
+        return auto_progress
+    if option is True:
+        return SpinnerProgress
+    if option is False or option is None:
+        return NullProgress
+    return option
@@ -0,0 +1,58 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class TokenBucket:
+    """Token bucket allowing rate requests per second on average, in bursts
+    of up to burst requests.
+
+    reserve() takes a token and returns how long to wait before using it;
+    tokens can be reserved ahead, so concurrent callers queue up in turn.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning the seconds to wait until it is available"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class EndpointLimits:
+    """Limits on requests to one endpoint: at most rate_limit requests per
+    second (in bursts of up to burst), and at most max_in_flight at once.
+    None means no limit."""
+
+    def __init__(
+        self, rate_limit=None, burst=None, max_in_flight=None, clock=time.monotonic
+    ):
+        self.rate_limit = rate_limit
+        self.max_in_flight = max_in_flight
+        self._bucket = TokenBucket(rate_limit, burst, clock) if rate_limit else None
+        self._in_flight = (
+            threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        )
+
+    def reserve(self):
+        """Seconds to wait before the next request may be sent"""
+        return self._bucket.reserve() if self._bucket else 0
+
+    def in_flight(self):
+        """Context manager holding one of the max_in_flight slots (for threads;
+        the async client keeps its own asyncio semaphores)"""
+        return self._in_flight if self._in_flight else nullcontext()
@@ -0,0 +1,81 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def retry_after_seconds(headers):
+    """The delay asked for by a Retry-After header (either seconds or an
+    HTTP date), or None if there isn't one"""
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """When, and after how long, to retry a failed request.
+
+    Only connection errors (and timeouts) and the statuses in retry_statuses
+    (by default 429 and 5xx gateway/server errors) are retried; anything else,
+    such as a 400 for a bad query, fails straight away. A request is tried at
+    most max_attempts times, waiting an exponentially growing delay (starting
+    at backoff seconds, capped at max_backoff) between attempts, with full
+    jitter so that retries to an endpoint are spread out. A Retry-After header
+    sent with a 429 or 503 is honoured instead. No retry is made that would
+    end after deadline seconds from the first attempt.
+
+    This only decides; the client does the waiting, with time.sleep or
+    asyncio.sleep as appropriate.
+    """
+
+    def __init__(
+        self,
+        max_attempts=5,
+        backoff=0.5,
+        max_backoff=10,
+        jitter=True,
+        deadline=30,
+        retry_statuses=RETRYABLE_STATUSES,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def is_retryable(self, status):
+        """Whether a response status (None for a connection error) is worth retrying"""
+        return status is None or status in self.retry_statuses
+
+    def backoff_delay(self, attempt):
+        """The delay after the attempt-th (from 1) failed attempt"""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def next_delay(self, attempt, status, headers=None, elapsed=0.0):
+        """Seconds to wait before retrying after the attempt-th (from 1) attempt
+        failed with status (None for a connection error), elapsed seconds after
+        the first attempt started; or None if it should not be retried"""
+        if attempt >= self.max_attempts or not self.is_retryable(status):
+            return None
+
+        delay = retry_after_seconds(headers)
+        if delay is None:
+            delay = self.backoff_delay(attempt)
+
+        if self.deadline is not None and elapsed + delay > self.deadline:
+            return None
+        return delay
@@ -0,0 +1,50 @@
+"""
+Parsing IPIF timestamps. Nearly all are ISO-8601, so are parsed with a regular
+expression; anything else falls back to dateutil's (much slower) parser.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+_ISO_8601 = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d{1,6})\d*)?)?)?"
+    r"(Z|[+-]\d{2}(?::?\d{2})?)?"
+)
+
+
+def _tzinfo(offset):
+    if offset is None:
+        return None
+    if offset == "Z":
+        return timezone.utc
+    sign = -1 if offset[0] == "-" else 1
+    digits = offset[1:].replace(":", "")
+    minutes = int(digits[:2]) * 60 + int(digits[2:] or 0)
+    return timezone(sign * timedelta(minutes=minutes)) if minutes else timezone.utc
+
+
+def parse_datetime(value):
+    """Parse an IPIF timestamp into a datetime, which is timezone-aware
+    if the timestamp has an offset"""
+    match = _ISO_8601.fullmatch(value.strip())
+    if match:
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        try:
+            return datetime(
+                int(year),
+                int(month),
+                int(day),
+                int(hour or 0),
+                int(minute or 0),
+                int(second or 0),
+                int((fraction or "0").ljust(6, "0")),
+                tzinfo=_tzinfo(offset),
+            )
+        except ValueError:
+            # e.g. a day out of range, which dateutil might make sense of
+            pass
+
+    from dateutil.parser import parse
+
+    return parse(value)
@@ -0,0 +1,105 @@
+class HoundSearch:
+    """Breadth-first search for an entity on endpoints that did not return it,
+    trying each URI the entity is known by on each of those endpoints.
+
+    URIs found in responses along the way are tried in the next round, up to
+    max_depth rounds and max_requests requests in total. No (endpoint, uri)
+    pair is tried twice, and the search stops once every endpoint has the
+    entity. This class only decides what to request: call next_frontier() for
+    the (endpoint_name, uri) pairs to request (concurrently), record() each
+    response, and repeat until next_frontier() returns nothing.
+
+    Responses found are put into resp_dict, {endpoint_name: data}.
+
+    If an IdentifierIndex is given, an endpoint where the entity has been
+    seen before is asked for it by its local @id, rather than by every URI.
+    """
+
+    def __init__(
+        self,
+        resp_dict,
+        endpoint_names,
+        max_depth=3,
+        max_requests=50,
+        identifier_index=None,
+        ipif_type=None,
+    ):
+        self.resp_dict = resp_dict
+        self.endpoint_names = list(endpoint_names)
+        self.max_depth = max_depth
+        self.max_requests = max_requests
+        self.identifier_index = identifier_index
+        self.ipif_type = ipif_type
+
+        self.depth = 0
+        self.requests_made = 0
+        self.visited = set()
+
+        # dicts used as ordered sets
+        self.known_uris = {}
+        # (endpoint_name, local @id) pairs
+        self.known_ids = {}
+        for endpoint_name, data in resp_dict.items():
+            if self._has_data(data):
+                self.visited.add((endpoint_name, data["@id"]))
+                self._learn_uris(endpoint_name, data)
+
+    @staticmethod
+    def _has_data(data):
+        return bool(data) and data != {"IPIF_STATUS": "Request failed"}
+
+    def _learn_uris(self, endpoint_name, data):
+        self.known_ids.setdefault((endpoint_name, data["@id"]))
+        for uri in data.get("uris", []):
+            self.known_uris.setdefault(uri)
+
+    def _known_local_ids(self):
+        if self.identifier_index is None:
+            return {}
+        return self.identifier_index.local_ids(
+            self.ipif_type, uris=self.known_uris, endpoint_ids=self.known_ids
+        )
+
+    def unresolved_endpoints(self):
+        return [
+            endpoint_name
+            for endpoint_name in self.endpoint_names
+            if not self._has_data(self.resp_dict.get(endpoint_name))
+        ]
+
+    def next_frontier(self):
+        """The (endpoint_name, uri) pairs to request in the next round"""
+        if self.depth >= self.max_depth:
+            return []
+
+        known_local_ids = self._known_local_ids()
+
+        frontier = []
+        for endpoint_name in self.unresolved_endpoints():
+            local_id = known_local_ids.get(endpoint_name)
+            if local_id is not None and (endpoint_name, local_id) not in self.visited:
+                # Go straight to the id we know, and only probe with URIs
+                # if that fails
+                frontier.append((endpoint_name, local_id))
+                continue
+            frontier += [
+                (endpoint_name, uri)
+                for uri in self.known_uris
+                if (endpoint_name, uri) not in self.visited
+            ]
+        if self.max_requests is not None:
+            frontier = frontier[: max(0, self.max_requests - self.requests_made)]
+
+        self.depth += 1
+        self.requests_made += len(frontier)
+        self.visited.update(frontier)
+        return frontier
+
+    def record(self, endpoint_name, uri, data):
+        """Record the response to requesting uri from endpoint_name"""
+        if self._has_data(data) and not self._has_data(
+            self.resp_dict.get(endpoint_name)
+        ):
+            self.resp_dict[endpoint_name] = data
+            self.visited.add((endpoint_name, data["@id"]))
+            self._learn_uris(endpoint_name, data)
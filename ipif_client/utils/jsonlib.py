@@ -0,0 +1,122 @@
+"""
+Decoding JSON responses: with a faster JSON library than the standard one if
+asked for, and incrementally, so the results on a page of search results can
+be used as they arrive rather than once the whole page has been parsed.
+"""
+
+import importlib
+import json
+
+from ..exceptions import IPIFClientConfigurationError
+
+JSON_LIBRARIES = ("json", "orjson", "ujson")
+
+# Bytes of the response body to read at a time when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def json_loads(library="json"):
+    """The loads function (taking bytes or str) of the JSON library for the
+    "json_library" config option: "json" (the standard library), "orjson" or
+    "ujson", or "auto" for the fastest of them that is installed"""
+    if library == "auto":
+        for name in ("orjson", "ujson"):
+            try:
+                return importlib.import_module(name).loads
+            except ImportError:
+                continue
+        return json.loads
+
+    if library not in JSON_LIBRARIES:
+        raise IPIFClientConfigurationError(
+            f"json_library must be 'auto' or one of {', '.join(JSON_LIBRARIES)}, "
+            f"not {library!r}"
+        )
+    try:
+        return importlib.import_module(library).loads
+    except ImportError:
+        raise IPIFClientConfigurationError(
+            f"json_library {library!r} is not installed"
+        ) from None
+
+
+class SearchPageParser:
+    """Incremental parser for a page of IPIF search results, which are in the
+    results_key array (e.g. "persons") of the response.
+
+    feed() it each chunk of the response body as it arrives: it returns the
+    results completed so far, each once. close() returns any left, and
+    raises ValueError if the page was not valid JSON. protocol is filled in
+    once it has been parsed.
+
+    Parsing is incremental with ijson; without it, the chunks are kept until
+    close(), which parses the whole page with loads.
+    """
+
+    def __init__(self, results_key, loads=json.loads):
+        self.protocol = {}
+        self._item_prefix = f"{results_key}.item"
+        self._loads = loads
+        self._results_key = results_key
+
+        try:
+            import ijson
+        except ImportError:
+            self._ijson = None
+            self._chunks = []
+            return
+
+        self._ijson = ijson
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events, use_float=True)
+        # Builder of the result (or protocol) being parsed, and its prefix
+        self._builder = None
+        self._building = None
+
+    def feed(self, chunk):
+        if self._ijson is None:
+            self._chunks.append(chunk)
+            return []
+
+        try:
+            self._parser.send(chunk)
+        except self._ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON in search results: {e}") from e
+        return self._completed()
+
+    def close(self):
+        if self._ijson is None:
+            page = self._loads(b"".join(self._chunks))
+            self._chunks = []
+            self.protocol = page.get("protocol", {})
+            return page.get(self._results_key, [])
+
+        try:
+            self._parser.close()
+        except self._ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON in search results: {e}") from e
+        return self._completed()
+
+    def _completed(self):
+        completed = []
+        for prefix, event, value in self._events:
+            if self._builder is None:
+                if prefix not in (self._item_prefix, "protocol"):
+                    continue
+                if event not in ("start_map", "start_array"):
+                    if prefix == self._item_prefix:
+                        # A result that is not an object
+                        completed.append(value)
+                    continue
+                self._builder = self._ijson.ObjectBuilder()
+                self._building = prefix
+
+            self._builder.event(event, value)
+            if prefix == self._building and event in ("end_map", "end_array"):
+                if prefix == "protocol":
+                    self.protocol = self._builder.value
+                else:
+                    completed.append(self._builder.value)
+                self._builder = None
+        del self._events[:]
+        return completed
@@ -0,0 +1,100 @@
+"""
+Reconciling IPIF Persons and Sources from several endpoints: any results that
+share one of their uris (directly, or through a chain of other results) are
+the same entity, and are merged into one. An @id is local to its endpoint (often
+just a number), so only links results from the same endpoint.
+"""
+
+
+class UnionFind:
+    """Disjoint sets of the integers 0..n-1"""
+
+    def __init__(self, n):
+        self._parent = list(range(n))
+        self._size = [1] * n
+
+    def find(self, i):
+        root = i
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # Path compression
+        while self._parent[i] != root:
+            self._parent[i], i = root, self._parent[i]
+        return root
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self._size[root_i] < self._size[root_j]:
+            root_i, root_j = root_j, root_i
+        self._parent[root_j] = root_i
+        self._size[root_i] += self._size[root_j]
+
+
+def reconciliation_keys(endpoint_name, data):
+    """The keys linking an IPIF entity returned by endpoint_name to others: its
+    @id, namespaced by the endpoint, and its uris, which are global"""
+    keys = [("uri", uri) for uri in data.get("uris", []) if uri]
+    if data.get("@id"):
+        keys.append(("@id", endpoint_name, data["@id"]))
+    return keys
+
+
+def merge_entity_dicts(items):
+    """Merge [(endpoint_name, data), ...] for the same entity into a new dict,
+    based on the first: factoid-refs from all of them are concatenated, each
+    tagged with its "ipif-endpoint", and uris combined"""
+    start_endpoint_name, start_dict = items[0]
+
+    merged = {**start_dict, "factoid-refs": [], "uris": []}
+    for endpoint_name, data in items:
+        merged["factoid-refs"] += [
+            {**factoid, "ipif-endpoint": endpoint_name}
+            for factoid in data.get("factoid-refs", [])
+        ]
+        merged["uris"] += data.get("uris", [])
+
+    merged["uris"] = list(dict.fromkeys(merged["uris"]))
+    return merged
+
+
+def merge_entities(data_dict, preferred_endpoint=None):
+    """Reconcile search results from several endpoints.
+
+    Takes {endpoint_name: [results]}, and returns a list of
+    (endpoint_name, merged_data) for each distinct entity, in the order
+    they first appear. The data of an entity is based on the result from
+    preferred_endpoint if there is one, otherwise the first.
+
+    Every key is indexed once, and results linked through union-find,
+    so this takes near-linear time in the number of results."""
+    items = [
+        (endpoint_name, data)
+        for endpoint_name, results in data_dict.items()
+        for data in results
+        if data and "IPIF_STATUS" not in data
+    ]
+
+    sets = UnionFind(len(items))
+    first_with_key = {}
+    for i, (endpoint_name, data) in enumerate(items):
+        for key in reconciliation_keys(endpoint_name, data):
+            if key in first_with_key:
+                sets.union(i, first_with_key[key])
+            else:
+                first_with_key[key] = i
+
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(sets.find(i), []).append(item)
+
+    merged = []
+    for group in groups.values():
+        preferred = [item for item in group if item[0] == preferred_endpoint]
+        if preferred:
+            group.remove(preferred[0])
+            group.insert(0, preferred[0])
+        merged.append((group[0][0], merge_entity_dicts(group)))
+
+    return merged
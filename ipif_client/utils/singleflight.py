@@ -0,0 +1,74 @@
+"""
+Coalescing concurrent identical requests: while a call for a key is in flight,
+other calls for the same key wait for its result rather than making their own.
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Single-flight calls for threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, func, *args):
+        """Call func(*args), unless a call for key is already in flight,
+        in which case wait for and return its result (or raise its error)"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def __len__(self):
+        return len(self._in_flight)
+
+
+class AsyncSingleFlight:
+    """Single-flight calls for tasks in an event loop. (asyncio is only
+    imported once a call is made, so the sync client doesn't load it.)"""
+
+    def __init__(self):
+        self._in_flight = {}
+
+    async def do(self, key, func, *args):
+        """Await func(*args), unless a call for key is already in flight,
+        in which case wait for and return its result (or raise its error)"""
+        import asyncio
+
+        task = self._in_flight.get(key)
+        if task is None:
+            # The call runs as a task of its own, which every caller (the
+            # first included) waits on shielded, so any of them being
+            # cancelled doesn't cancel the call, or the others
+            task = self._in_flight[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda done: self._call_done(key, done))
+        return await asyncio.shield(task)
+
+    def _call_done(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark any error as seen, in case every caller has been cancelled
+            task.exception()
+
+    def __len__(self):
+        return len(self._in_flight)
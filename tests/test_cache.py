@@ -0,0 +1,158 @@
+import time
+
+from ipif_client.cache import ResponseCache, SQLiteResponseCache
+from ipif_client.ipif import IPIF
+
+from .test_data import TEST_PERSON_RESPONSE, TEST_PERSON_SEARCH_RESPONSE
+
+
+def test_response_cache_lookup_counts_hits_and_misses():
+    cache = ResponseCache()
+
+    assert cache.lookup(("A", "persons", "1")) == (False, None)
+
+    cache[("A", "persons", "1")] = {"@id": "1"}
+    cache[("A", "persons", "2")] = None
+
+    assert cache.lookup(("A", "persons", "1")) == (True, {"@id": "1"})
+    # A cached 404 is still a hit
+    assert cache.lookup(("A", "persons", "2")) == (True, None)
+
+    assert cache.stats() == {"hits": 2, "misses": 1, "size": 2}
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_size=2)
+
+    cache[("A", "persons", "1")] = {"@id": "1"}
+    cache[("A", "persons", "2")] = {"@id": "2"}
+    cache.lookup(("A", "persons", "1"))
+    cache[("A", "persons", "3")] = {"@id": "3"}
+
+    assert ("A", "persons", "1") in cache
+    assert ("A", "persons", "2") not in cache
+    assert ("A", "persons", "3") in cache
+    assert len(cache) == 2
+
+
+def test_response_cache_ttls_by_kind_of_response():
+    cache = ResponseCache(ttl=0.05, not_found_ttl=0.2, failure_ttl=0)
+
+    cache[("A", "persons", "found")] = {"@id": "found"}
+    cache[("A", "persons", "missing")] = None
+    cache[("A", "persons", "failed")] = {"IPIF_STATUS": "Request failed"}
+
+    assert ("A", "persons", "found") in cache
+    assert ("A", "persons", "missing") in cache
+    # Failures are not kept at all with a TTL of 0
+    assert ("A", "persons", "failed") not in cache
+
+    time.sleep(0.1)
+
+    assert ("A", "persons", "found") not in cache
+    assert ("A", "persons", "missing") in cache
+
+
+def test_response_cache_invalidate():
+    cache = ResponseCache()
+    cache[("A", "persons", "1")] = {"@id": "1"}
+    cache[("A", "persons", "2")] = {"@id": "2"}
+    cache[("B", "persons", "1")] = {"@id": "1"}
+
+    cache.invalidate(("A", "persons", "1"))
+    assert ("A", "persons", "1") not in cache
+
+    cache.invalidate(endpoint_name="A")
+    assert len(cache) == 1
+
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_ipif_caches_search_requests(httpserver):
+    httpserver.expect_oneshot_request("/persons").respond_with_json(
+        TEST_PERSON_SEARCH_RESPONSE
+    )
+
+    cache = ResponseCache()
+    ipif = IPIF({"cache": cache, "retries": 0})
+    ipif.add_endpoint(name="APIS", uri=httpserver.url_for("/"))
+
+    first = ipif._base_query_request("APIS", "Persons", {"sourceId": "someSource"})
+    # The one-shot handler is used up, so this must come from the cache
+    second = ipif._base_query_request("APIS", "Persons", {"sourceId": "someSource"})
+
+    assert first == second == TEST_PERSON_SEARCH_RESPONSE
+    assert cache.hits == 1
+
+    ipif.invalidate_cache("APIS")
+    assert (
+        ipif._base_query_request("APIS", "Persons", {"sourceId": "someSource"}) is None
+    )
+
+
+def test_sqlite_response_cache_is_shared_between_instances(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    writer = SQLiteResponseCache(path)
+    reader = SQLiteResponseCache(path)
+
+    writer[("A", "persons", "1")] = TEST_PERSON_RESPONSE
+    writer[("A", "persons", "missing")] = None
+    writer[("A", "persons", (("page", 1), ("sourceId", "x")))] = {"persons": []}
+
+    assert reader.lookup(("A", "persons", "1")) == (True, TEST_PERSON_RESPONSE)
+    assert reader.lookup(("A", "persons", "missing")) == (True, None)
+    assert reader[("A", "persons", (("page", 1), ("sourceId", "x")))] == {"persons": []}
+    assert ("A", "persons", "2") not in reader
+
+    reader.invalidate(endpoint_name="A")
+    assert len(writer) == 0
+
+
+def test_sqlite_response_cache_expires_and_caps_size(tmp_path):
+    cache = SQLiteResponseCache(
+        tmp_path / "cache.sqlite", max_size=2, ttl=0.05, prune_every=1
+    )
+
+    cache[("A", "persons", "1")] = {"@id": "1"}
+    time.sleep(0.1)
+    assert ("A", "persons", "1") not in cache
+
+    for n in range(3):
+        cache.set(("A", "persons", str(n)), {"@id": str(n)}, ttl=60)
+
+    assert len(cache) == 2
+    assert ("A", "persons", "0") not in cache
+    assert ("A", "persons", "2") in cache
+
+
+def test_sqlite_response_cache_prunes_every_so_many_writes(tmp_path, mocker):
+    cache = SQLiteResponseCache(tmp_path / "cache.sqlite", max_size=5, prune_every=10)
+    prune = mocker.spy(cache, "prune")
+
+    for n in range(12):
+        cache[("A", "persons", str(n))] = {"@id": str(n)}
+    assert prune.call_count == 1
+    assert len(cache) == 7
+
+    cache.set(("A", "persons", "x"), {"@id": "x"}, ttl=0.01)
+    time.sleep(0.02)
+    cache.prune()
+    assert len(cache) == 5
+    assert ("A", "persons", "11") in cache
+    assert ("A", "persons", "6") not in cache
+
+    indexes = {
+        row[1] for row in cache._connection().execute("PRAGMA index_list(responses)")
+    }
+    assert {"responses_stored", "responses_expires"} <= indexes
+
+
+def test_ipif_with_cache_path(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    SQLiteResponseCache(path)[("TEST", "persons", "39986")] = TEST_PERSON_RESPONSE
+
+    ipif = IPIF({"cache_path": path, "endpoints": {"TEST": "http://test/"}})
+
+    person = ipif.Persons.id("39986")
+    assert person.id == "TEST::39986"
@@ -0,0 +1,122 @@
+import pytest
+from requests.exceptions import ChunkedEncodingError
+
+from ipif_client.health import CLOSED, HALF_OPEN, OPEN, EndpointHealth
+from ipif_client.ipif import IPIF
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers():
+    clock = FakeClock()
+    health = EndpointHealth(failure_threshold=3, reset_timeout=10, clock=clock)
+
+    for _ in range(3):
+        assert health.allow_request()
+        health.record(False, 0.1)
+
+    assert health.state == OPEN
+    assert not health.allow_request()
+
+    # Half-open after the reset timeout: a single probe is let through
+    clock.now = 10
+    assert health.allow_request()
+    assert health.state == HALF_OPEN
+    assert not health.allow_request()
+
+    # A failed probe reopens the circuit...
+    health.record(False, 0.1)
+    assert health.state == OPEN
+    assert not health.allow_request()
+
+    # ...and a successful one closes it
+    clock.now = 20
+    assert health.allow_request()
+    health.record(True, 0.1)
+    assert health.state == CLOSED
+    assert health.allow_request()
+
+
+def test_abandoned_probe_lets_another_through():
+    clock = FakeClock()
+    health = EndpointHealth(failure_threshold=1, reset_timeout=10, clock=clock)
+    health.record(False, 0.1)
+
+    clock.now = 10
+    assert health.allow_request()
+    assert not health.allow_request()
+    health.abandon()
+    assert health.state == HALF_OPEN
+    assert health.allow_request()
+
+
+def test_circuit_opens_on_error_rate():
+    health = EndpointHealth(failure_threshold=100, min_requests=10)
+    for i in range(10):
+        health.record(i % 2 == 0, 0.1)
+    assert health.state == OPEN
+
+    health = EndpointHealth(failure_threshold=3, enabled=False)
+    for _ in range(5):
+        health.record(False, 0.1)
+    assert health.allow_request()
+
+
+def test_health_snapshot_reports_latency_percentiles():
+    health = EndpointHealth()
+    for n in range(1, 101):
+        health.record(n <= 90, n / 100)
+
+    snapshot = health.snapshot()
+    assert snapshot["requests"] == 100
+    assert snapshot["error_rate"] == 0.1
+    assert snapshot["latency_p50"] == 0.5
+    assert snapshot["latency_p95"] == 0.95
+    assert snapshot["latency_p99"] == 0.99
+
+
+def test_ipif_skips_endpoint_with_open_circuit(mocker):
+    ipif = IPIF({"retries": 0, "circuit_breaker": {"failure_threshold": 2}})
+    ipif.add_endpoint("DOWN", uri="http://not_there.net/")
+    requester = mocker.spy(ipif._session, "get")
+
+    for n in range(5):
+        assert ipif._request_single_object_by_id("DOWN", "Persons", f"id{n}") == {
+            "IPIF_STATUS": "Request failed"
+        }
+
+    assert requester.call_count == 2
+    assert ipif.endpoint_health("DOWN")["state"] == "open"
+    assert ipif.endpoint_health()["DOWN"]["consecutive_failures"] == 2
+
+    ipif.reset_endpoint_health("DOWN")
+    assert ipif.endpoint_health("DOWN")["state"] == "closed"
+
+
+@pytest.mark.parametrize("error", [ChunkedEncodingError, RuntimeError])
+def test_ipif_records_probe_that_raises(mocker, error):
+    clock = FakeClock()
+    ipif = IPIF({"retries": 0, "circuit_breaker": {"failure_threshold": 1}})
+    ipif.add_endpoint("FLAKY", uri="http://flaky.net/")
+    health = ipif._health["FLAKY"]
+    health._clock = clock
+    health.record(False, 0.1)
+    assert health.state == OPEN
+
+    mocker.patch.object(ipif._session, "get", side_effect=error("oops"))
+    clock.now = health.reset_timeout
+    try:
+        ipif._get("FLAKY", "http://flaky.net/persons/1")
+    except RuntimeError:
+        pass
+
+    # The failed probe reopened the circuit, rather than leaving it waiting
+    assert health.state == OPEN
+    clock.now += health.reset_timeout
+    assert health.allow_request()
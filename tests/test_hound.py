@@ -0,0 +1,90 @@
+from ipif_client.ipif import IPIF
+from ipif_client.utils.hound import HoundSearch
+
+
+def person(id_string, uris):
+    return {"@id": id_string, "uris": uris, "factoid-refs": []}
+
+
+# As in figure_out_reconcile_ids.py: S3 only knows the person by a URI that
+# only S2 knows about, so it takes two rounds to find it there
+SERVER_ENDPOINTS = {
+    "S1": person("TJones", ["JonesT"]),
+    "S2": person("JonesT2", ["JonesT", "T_JONES"]),
+    "S3": person("T_JONES3", ["T_JONES"]),
+    "SE": None,
+}
+
+
+def get_from_endpoint(endpoint_name, uri):
+    data = SERVER_ENDPOINTS[endpoint_name]
+    if data and (uri == data["@id"] or uri in data["uris"]):
+        return data
+    return None
+
+
+def run_search(search):
+    requests = []
+    frontier = search.next_frontier()
+    while frontier:
+        requests.append(frontier)
+        for endpoint_name, uri in frontier:
+            search.record(endpoint_name, uri, get_from_endpoint(endpoint_name, uri))
+        frontier = search.next_frontier()
+    return requests
+
+
+def test_hound_search_follows_uris_found_on_the_way():
+    resp_dict = {"S1": SERVER_ENDPOINTS["S1"]}
+    search = HoundSearch(resp_dict, SERVER_ENDPOINTS)
+
+    requests = run_search(search)
+
+    assert requests == [
+        [("S2", "JonesT"), ("S3", "JonesT"), ("SE", "JonesT")],
+        [("S3", "T_JONES"), ("SE", "T_JONES")],
+    ]
+    assert resp_dict == {
+        "S1": SERVER_ENDPOINTS["S1"],
+        "S2": SERVER_ENDPOINTS["S2"],
+        "S3": SERVER_ENDPOINTS["S3"],
+    }
+
+
+def test_hound_search_limits():
+    resp_dict = {"S1": SERVER_ENDPOINTS["S1"]}
+    requests = run_search(HoundSearch(resp_dict, SERVER_ENDPOINTS, max_depth=1))
+    assert len(requests) == 1
+    assert "S3" not in resp_dict
+
+    resp_dict = {"S1": SERVER_ENDPOINTS["S1"]}
+    requests = run_search(HoundSearch(resp_dict, SERVER_ENDPOINTS, max_requests=4))
+    assert sum(len(r) for r in requests) == 4
+
+
+def test_hound_search_stops_when_all_endpoints_resolved():
+    resp_dict = {"S1": SERVER_ENDPOINTS["S1"]}
+    requests = run_search(HoundSearch(resp_dict, ["S1", "S2"]))
+    assert requests == [[("S2", "JonesT")]]
+
+
+def test_get_by_id_hounds_breadth_first(mocker):
+    ipif = IPIF()
+    for endpoint_name in SERVER_ENDPOINTS:
+        ipif.add_endpoint(endpoint_name, f"http://{endpoint_name.lower()}/")
+
+    mocker.patch.object(
+        IPIF,
+        "_request_single_object_by_id",
+        autospec=True,
+        side_effect=lambda self, endpoint_name, ipif_type, uri: get_from_endpoint(
+            endpoint_name, uri
+        ),
+    )
+
+    found = ipif.Persons.id("TJones")
+
+    assert found.id == "S1::TJones"
+    assert set(found.uris) == {"JonesT", "T_JONES"}
+    # One request to each endpoint, then five more in hound mode
+    assert IPIF._request_single_object_by_id.call_count == 4 + 5
@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+from ipif_client.identifier_index import IdentifierIndex
+from ipif_client.ipif import IPIF
+from ipif_client.utils.hound import HoundSearch
+
+from .test_hound import SERVER_ENDPOINTS, get_from_endpoint, run_search
+
+
+def test_identifier_index_learn_and_look_up():
+    index = IdentifierIndex()
+    index.learn("S2", "Persons", SERVER_ENDPOINTS["S2"])
+    index.learn("S3", "Persons", SERVER_ENDPOINTS["S3"])
+
+    assert index.local_ids("persons", ["JonesT"]) == {"S2": "JonesT2"}
+    assert index.local_ids("persons", ["T_JONES"]) == {
+        "S2": "JonesT2",
+        "S3": "T_JONES3",
+    }
+    assert index.local_ids("sources", ["T_JONES"]) == {}
+
+
+def test_identifier_index_save_and_load(tmp_path):
+    path = tmp_path / "index.json"
+    index = IdentifierIndex(path)
+    index.learn("S3", "Persons", SERVER_ENDPOINTS["S3"])
+    index.save()
+
+    loaded = IdentifierIndex(path)
+    assert len(loaded) == len(index)
+    assert loaded.local_ids("persons", ["T_JONES"]) == {"S3": "T_JONES3"}
+
+
+def test_identifier_index_keeps_local_ids_apart_by_endpoint():
+    index = IdentifierIndex()
+    # Different people, with the same local @id on two endpoints
+    index.learn("A", "Persons", {"@id": "5", "uris": ["http://gnd/a"]})
+    index.learn("B", "Persons", {"@id": "5", "uris": ["http://gnd/b"]})
+    index.learn_equivalents(
+        "Persons", [("A", {"@id": "5"}), ("C", {"@id": "c5", "uris": ["http://x"]})]
+    )
+
+    assert index.local_ids("persons", ["http://gnd/a"]) == {"A": "5"}
+    assert index.local_ids("persons", endpoint_ids=[("A", "5")]) == {
+        "A": "5",
+        "C": "c5",
+    }
+    assert index.local_ids("persons", ["http://gnd/b"]) == {"B": "5"}
+    assert index.local_ids("persons", endpoint_ids=[("B", "5")]) == {"B": "5"}
+    assert index.local_ids("persons", ["5"]) == {}
+
+
+def test_identifier_index_save_replaces_file_whole(tmp_path, mocker):
+    path = tmp_path / "index.json"
+    index = IdentifierIndex(path)
+    index.learn("S3", "Persons", SERVER_ENDPOINTS["S3"])
+    index.save()
+    saved = path.read_text()
+
+    index.learn("S2", "Persons", SERVER_ENDPOINTS["S2"])
+    mocker.patch("ipif_client.identifier_index.json.dump", side_effect=OSError)
+    with pytest.raises(OSError):
+        index.save()
+
+    assert path.read_text() == saved
+    assert [p.name for p in tmp_path.iterdir()] == ["index.json"]
+
+
+def test_identifier_index_ignores_entries_without_endpoints(tmp_path):
+    path = tmp_path / "index.json"
+    path.write_text(json.dumps([["persons", "5", {"A": "5"}]]))
+    assert len(IdentifierIndex(path)) == 0
+
+
+def test_ipif_saves_identifier_index_on_leaving_with_block(tmp_path):
+    path = tmp_path / "index.json"
+    with IPIF({"identifier_index_path": path}) as ipif:
+        ipif._identifier_index.learn("S3", "Persons", SERVER_ENDPOINTS["S3"])
+
+    assert IdentifierIndex(path).local_ids("persons", ["T_JONES"]) == {"S3": "T_JONES3"}
+
+
+def test_hound_search_goes_straight_to_known_local_id():
+    index = IdentifierIndex()
+    index.learn("S3", "Persons", SERVER_ENDPOINTS["S3"])
+
+    resp_dict = {"S1": SERVER_ENDPOINTS["S1"], "S2": SERVER_ENDPOINTS["S2"]}
+    requests = run_search(
+        HoundSearch(
+            resp_dict, ["S1", "S2", "S3"], identifier_index=index, ipif_type="persons"
+        )
+    )
+
+    assert requests == [[("S3", "T_JONES3")]]
+    assert resp_dict["S3"] == SERVER_ENDPOINTS["S3"]
+
+
+def test_ipif_remembers_reconciled_ids_between_runs(tmp_path, mocker):
+    path = tmp_path / "index.json"
+
+    def make_ipif():
+        ipif = IPIF({"identifier_index_path": path})
+        for endpoint_name in SERVER_ENDPOINTS:
+            ipif.add_endpoint(endpoint_name, f"http://{endpoint_name.lower()}/")
+        return ipif
+
+    mocker.patch.object(
+        IPIF,
+        "_request_single_object_by_id",
+        autospec=True,
+        side_effect=lambda self, endpoint_name, ipif_type, uri: get_from_endpoint(
+            endpoint_name, uri
+        ),
+    )
+
+    with make_ipif() as ipif:
+        ipif.Persons.id("TJones")
+    assert IPIF._request_single_object_by_id.call_count == 4 + 5
+
+    IPIF._request_single_object_by_id.reset_mock()
+    with make_ipif() as ipif:
+        found = ipif.Persons.id("TJones")
+
+    # After asking each endpoint for TJones (S1's own @id, so not looked up),
+    # S2 and S3 are asked for their own @ids straight away; only SE, which
+    # has never had this person, is still probed with each URI
+    requested = [c.args[1:] for c in IPIF._request_single_object_by_id.call_args_list]
+    assert requested[:4] == [(e, "persons", "TJones") for e in SERVER_ENDPOINTS]
+    assert sorted(requested[4:]) == [
+        ("S2", "persons", "JonesT2"),
+        ("S3", "persons", "T_JONES3"),
+        ("SE", "persons", "JonesT"),
+        ("SE", "persons", "T_JONES"),
+    ]
+    assert set(found.uris) == {"JonesT", "T_JONES"}
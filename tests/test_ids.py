@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import pytest
+
+from ipif_client.ipif import IPIF
+
+from .test_hound import SERVER_ENDPOINTS, get_from_endpoint, person
+
+# A second person, known to S1 and (by a URI) S2 only
+OTHER_PERSON = {
+    "S1": person("ASmith", ["SmithA"]),
+    "S2": person("SmithA2", ["SmithA"]),
+}
+
+
+def fake_request(self, endpoint_name, ipif_type, uri):
+    other = OTHER_PERSON.get(endpoint_name)
+    if other and (uri == other["@id"] or uri in other["uris"]):
+        return other
+    return get_from_endpoint(endpoint_name, uri)
+
+
+def make_ipif(cls=IPIF):
+    ipif = cls({"retries": 0})
+    for endpoint_name in SERVER_ENDPOINTS:
+        ipif.add_endpoint(endpoint_name, f"http://{endpoint_name.lower()}/")
+    return ipif
+
+
+def test_ids_returns_dict_of_entities(mocker):
+    mocker.patch.object(
+        IPIF, "_request_single_object_by_id", autospec=True, side_effect=fake_request
+    )
+    ipif = make_ipif()
+
+    people = ipif.Persons.ids(["TJones", "ASmith", "TJones", "Nobody"])
+
+    assert list(people) == ["TJones", "ASmith", "Nobody"]
+    assert people["TJones"].id == "S1::TJones"
+    assert set(people["TJones"].uris) == {"JonesT", "T_JONES"}
+    assert set(people["ASmith"].uris) == {"SmithA"}
+    assert people["Nobody"] is None
+
+    requested = [c.args[1:] for c in IPIF._request_single_object_by_id.call_args_list]
+    # Each id from each endpoint once, then hounding for both together
+    assert len(requested) == 3 * len(SERVER_ENDPOINTS) + len(set(requested[12:]))
+    assert len(requested) == len(set(requested))
+
+
+def test_ids_hounds_for_the_whole_batch_together(mocker):
+    mocker.patch.object(
+        IPIF, "_request_single_object_by_id", autospec=True, side_effect=fake_request
+    )
+    ipif = make_ipif()
+    rounds = mocker.spy(ipif, "_run_concurrently")
+
+    ipif.Persons.ids(["TJones", "ASmith"])
+
+    # One round for the ids, then two rounds of hounding shared by both
+    assert rounds.call_count == 3
+
+
+def test_ids_as_completed_yields_each_entity(mocker):
+    mocker.patch.object(
+        IPIF, "_request_single_object_by_id", autospec=True, side_effect=fake_request
+    )
+    ipif = make_ipif()
+    ipif._hound_mode = False
+
+    results = ipif.Persons.ids(["TJones", "ASmith"], as_completed=True)
+
+    assert not isinstance(results, dict)
+    assert {id_string: p.id for id_string, p in results} == {
+        "TJones": "S1::TJones",
+        "ASmith": "S1::ASmith",
+    }
+
+
+def test_ids_as_completed_stops_requesting_when_closed(mocker):
+    def slow_request(self, endpoint_name, ipif_type, uri):
+        time.sleep(0.01)
+        return None
+
+    requester = mocker.patch.object(
+        IPIF, "_request_single_object_by_id", autospec=True, side_effect=slow_request
+    )
+    ipif = IPIF({"retries": 0, "max_concurrent_requests": 4})
+    ipif.add_endpoint("S1", "http://s1/")
+    ipif._hound_mode = False
+
+    results = ipif.Persons.ids([f"id{n}" for n in range(400)], as_completed=True)
+    next(results)
+    results.close()
+
+    # Only those already in flight are finished off
+    assert requester.call_count < 20
+
+
+def test_async_ids_as_completed_stops_requesting_when_closed(mocker):
+    pytest.importorskip("aiohttp")
+    from ipif_client import AsyncIPIF
+
+    async def slow_request(self, endpoint_name, ipif_type, uri):
+        await asyncio.sleep(0.01)
+        return None
+
+    requester = mocker.patch.object(
+        AsyncIPIF,
+        "_request_single_object_by_id",
+        autospec=True,
+        side_effect=slow_request,
+    )
+
+    async def run():
+        ipif = AsyncIPIF({"retries": 0, "max_concurrent_requests": 4})
+        ipif.add_endpoint("S1", "http://s1/")
+        ipif._hound_mode = False
+
+        results = ipif.Persons.ids([f"id{n}" for n in range(400)], as_completed=True)
+        await results.__anext__()
+        await results.aclose()
+        # Give anything not cancelled the chance to run
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+
+    # Only those already in flight are finished off
+    assert requester.call_count < 20
+
+
+def test_async_ids(mocker):
+    pytest.importorskip("aiohttp")
+    from ipif_client import AsyncIPIF
+
+    async def fake_async_request(self, endpoint_name, ipif_type, uri):
+        return fake_request(self, endpoint_name, ipif_type, uri)
+
+    mocker.patch.object(
+        AsyncIPIF,
+        "_request_single_object_by_id",
+        autospec=True,
+        side_effect=fake_async_request,
+    )
+
+    async def run():
+        ipif = make_ipif(AsyncIPIF)
+        people = await ipif.Persons.ids(["TJones", "ASmith", "Nobody"])
+        streamed = {
+            id_string: p
+            async for id_string, p in ipif.Persons.ids(
+                ["TJones", "ASmith"], as_completed=True
+            )
+        }
+        return people, streamed
+
+    people, streamed = asyncio.run(run())
+    assert set(people["TJones"].uris) == {"JonesT", "T_JONES"}
+    assert people["Nobody"] is None
+    assert set(streamed) == {"TJones", "ASmith"}
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ("requests", "aiohttp", "yaspin", "dateutil", "asyncio")
+
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def test_importing_package_defers_heavy_imports():
+    loaded = run_python(
+        "import sys; import ipif_client; from ipif_client import IPIF; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert loaded == ""
+
+
+def test_import_time():
+    code = (
+        "import time; start = time.perf_counter(); "
+        "from ipif_client import IPIF; print(time.perf_counter() - start)"
+    )
+    # Best of a few runs, to keep noise down. Importing requests, aiohttp and
+    # dateutil eagerly took about 0.3s
+    assert min(float(run_python(code)) for _ in range(3)) < 0.15
@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from ipif_client import AsyncIPIF
+from ipif_client.exceptions import IPIFClientDataError
+
+from .test_data import (
+    TEST_FACTOID_RESPONSE,
+    TEST_PERSON_RESPONSE,
+    TEST_STATEMENT_RESPONSE,
+)
+from .test_ipif_client import fake_iterated_response
+
+
+def test_async_request_single_object_by_id(httpserver):
+    httpserver.expect_request("/persons/anIdString").respond_with_json(
+        {"@id": "anIdString"}
+    )
+    httpserver.expect_request("/persons/MISSING").respond_with_data(
+        "Not found", status=404
+    )
+
+    async def run():
+        async with AsyncIPIF({"retries": 0}) as ipif:
+            ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+            return (
+                await ipif._request_single_object_by_id(
+                    "TEST", "Persons", "anIdString"
+                ),
+                await ipif._request_single_object_by_id("TEST", "Persons", "MISSING"),
+                await ipif._request_single_object_by_id("TEST", "Persons", "ARSE"),
+            )
+
+    found, missing, failed = asyncio.run(run())
+    assert found == {"@id": "anIdString"}
+    assert missing is None
+    assert failed == {"IPIF_STATUS": "Request failed"}
+
+
+def test_async_persons_id_is_awaitable(httpserver):
+    httpserver.expect_request(
+        f"/persons/{TEST_PERSON_RESPONSE['@id']}"
+    ).respond_with_json(TEST_PERSON_RESPONSE)
+
+    async def run():
+        async with AsyncIPIF({"endpoints": {"TEST": httpserver.url_for("/")}}) as ipif:
+            return ipif, await ipif.Persons.id(TEST_PERSON_RESPONSE["@id"])
+
+    ipif, person = asyncio.run(run())
+
+    assert isinstance(person, ipif.Persons)
+    assert person.id == "TEST::39986"
+    assert person.label == "Schneller, István (39986)"
+    assert person.factoids[0].id == "factoid__39986__original_source_3994"
+
+
+def test_async_factoid_id_and_fetching_refs():
+    async def run():
+        ipif = AsyncIPIF()
+        ipif.add_endpoint("TEST", "http://test/")
+        ipif._data_cache[
+            ("TEST", "factoids", TEST_FACTOID_RESPONSE["@id"])
+        ] = TEST_FACTOID_RESPONSE
+        ipif._data_cache[
+            ("TEST", "statements", "39986_PersonInstitution_95989")
+        ] = TEST_STATEMENT_RESPONSE
+
+        f = await ipif.Factoids.id(TEST_FACTOID_RESPONSE["@id"])
+        st = f.statements[0]
+
+        # Ref-only objects cannot be loaded synchronously on attribute access
+        with pytest.raises(AttributeError):
+            st.name
+
+        await st.fetch()
+        return st
+
+    st = asyncio.run(run())
+    assert st._ref_only is False
+    assert st.name == "Lebowski, Lebowski"
+
+
+def test_async_factoid_id_with_two_matches():
+    async def run():
+        ipif = AsyncIPIF()
+        ipif.add_endpoint("WORKS", "http://works")
+        ipif.add_endpoint("ALSO_WORKS", "http://also_works")
+        for endpoint_name in ("WORKS", "ALSO_WORKS"):
+            ipif._data_cache[
+                (endpoint_name, "factoids", TEST_FACTOID_RESPONSE["@id"])
+            ] = TEST_FACTOID_RESPONSE
+        await ipif.Factoids.id(TEST_FACTOID_RESPONSE["@id"])
+
+    with pytest.raises(IPIFClientDataError):
+        asyncio.run(run())
+
+
+def test_async_queryset_supports_async_for(httpserver):
+    for i in range(4):
+        httpserver.expect_request(
+            "/persons",
+            query_string={"sourceId": "someSourceId", "page": str(i + 1), "size": "30"},
+        ).respond_with_json(fake_iterated_response(100, 30, i + 1))
+
+    async def run():
+        async with AsyncIPIF({"endpoints": {"TEST": httpserver.url_for("/")}}) as ipif:
+            qs = ipif.Persons.sourceId("someSourceId")
+            with pytest.raises(TypeError):
+                iter(qs)
+            return [p async for p in qs]
+
+    results = asyncio.run(run())
+    assert [p.id for p in results] == [f"TEST::ID_{n}" for n in range(1, 101)]
+
+
+def test_async_queryset_streams_pages(httpserver):
+    for i in range(4):
+        httpserver.expect_request(
+            "/persons",
+            query_string={"sourceId": "someSourceId", "page": str(i + 1), "size": "30"},
+        ).respond_with_json(fake_iterated_response(100, 30, i + 1))
+
+    async def run():
+        async with AsyncIPIF(
+            {"endpoints": {"TEST": httpserver.url_for("/")}, "stream": True}
+        ) as ipif:
+            return [p async for p in ipif.Persons.sourceId("someSourceId")]
+
+    results = asyncio.run(run())
+    assert [p.id for p in results] == [f"TEST::ID_{n}" for n in range(1, 101)]
+
+
+def test_async_queryset_yields_results_as_they_arrive_unless_prefetching(mocker):
+    consumed = []
+
+    async def results(endpoint_name, ipif_type, search_params):
+        for n in range(100):
+            consumed.append(n)
+            yield {"@id": f"ID_{n}"}
+
+    async def run(ipif, qs):
+        consumed.clear()
+        first = await qs.first()
+        return first.id, len(consumed)
+
+    ipif = AsyncIPIF()
+    ipif.add_endpoint("TEST", "http://test/")
+    mocker.patch.object(ipif, "_iterate_results_from_single_endpoint", results)
+
+    assert asyncio.run(run(ipif, ipif.Persons.sourceId("x"))) == ("TEST::ID_0", 1)
+    # Prefetching waits for a page, to fetch its refs together
+    assert asyncio.run(run(ipif, ipif.Persons.sourceId("x").prefetch("factoids"))) == (
+        "TEST::ID_0",
+        ipif._DEFAULT_PAGE_REQUEST_SIZE,
+    )
+
+
+def test_async_hydrate():
+    async def run():
+        ipif = AsyncIPIF()
+        ipif.add_endpoint("TEST", "http://test/")
+        ipif._data_cache[
+            ("TEST", "factoids", TEST_FACTOID_RESPONSE["@id"])
+        ] = TEST_FACTOID_RESPONSE
+        ipif._data_cache[
+            ("TEST", "statements", "39986_PersonInstitution_95989")
+        ] = TEST_STATEMENT_RESPONSE
+
+        f = await ipif.Factoids.id(TEST_FACTOID_RESPONSE["@id"])
+        await ipif.hydrate(f.statements[:1], depth=0)
+        return f
+
+    f = asyncio.run(run())
+    assert f.statements[0].name == "Lebowski, Lebowski"
+
+
+def test_async_hydrate_fetches_factoid_refs():
+    async def run():
+        ipif = AsyncIPIF()
+        ipif.add_endpoint("TEST", "http://test/")
+        ipif._data_cache[
+            ("TEST", "persons", TEST_PERSON_RESPONSE["@id"])
+        ] = TEST_PERSON_RESPONSE
+        ipif._data_cache[
+            ("TEST", "factoids", TEST_FACTOID_RESPONSE["@id"])
+        ] = TEST_FACTOID_RESPONSE
+
+        person = await ipif.Persons.id(TEST_PERSON_RESPONSE["@id"])
+        with pytest.raises(AttributeError):
+            person.factoids[0].createdWhen
+
+        await ipif.hydrate(person, depth=1)
+        return person
+
+    person = asyncio.run(run())
+    factoid = person.factoids[0]
+    assert factoid._ref_only is False
+    assert factoid.createdWhen.isoformat() == "2016-10-03T20:53:28+00:00"
@@ -1,7 +1,11 @@
+import json
+
 import pytest
 import requests
 import time
 
+from werkzeug.wrappers import Response
+
 from ipif_client import __version__
 
 from ipif_client.ipif import IPIF
@@ -91,6 +95,31 @@ def test_ipif_initialises_with_ipif_type_classes():
     assert ipif.Factoids._ipif_instance._endpoints["APIS"] == URI
 
 
+def test_ipif_reuses_connections_to_endpoint(httpserver):
+    httpserver.expect_request("/persons/anIdString").respond_with_json(
+        {"@id": "anIdString"}
+    )
+    httpserver.expect_request("/persons").respond_with_json(TEST_PERSON_SEARCH_RESPONSE)
+
+    ipif = IPIF({"pool_size": 2})
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+
+    adapter = ipif._session.get_adapter(httpserver.url_for("/persons"))
+    assert adapter._pool_maxsize == 2
+
+    ipif._request_single_object_by_id("TEST", "Persons", "anIdString")
+    ipif._base_query_request("TEST", "Persons", {"sourceId": "someSource"})
+
+    # Both requests went over the same pooled connection
+    assert len(adapter.poolmanager.pools) == 1
+    (pool_key,) = adapter.poolmanager.pools.keys()
+    pool = adapter.poolmanager.pools[pool_key]
+    assert pool.num_connections == 1
+    assert pool.num_requests == 2
+
+    ipif.close()
+
+
 def test_http_server_mock(httpserver):
     httpserver.expect_request("/foobar").respond_with_json({"foo": "bar"})
     # check that the request is served
@@ -112,7 +141,7 @@ def test_request_single_object_by_id(httpserver):
         {"@id": "anIdString"}
     )
 
-    ipif = IPIF()
+    ipif = IPIF({"retries": 0})
     ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
 
     # Test we get a result as planned
@@ -133,6 +162,90 @@ def test_request_single_object_by_id(httpserver):
     }
 
 
+def test_request_single_object_by_id_revalidates_with_etag(httpserver):
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return Response(status=304, headers={"ETag": '"v1"'})
+        return Response(
+            json.dumps({"@id": "anIdString"}),
+            content_type="application/json",
+            headers={"ETag": '"v1"'},
+        )
+
+    httpserver.expect_request("/persons/anIdString").respond_with_handler(handler)
+
+    ipif = IPIF({"revalidate_after": 0})
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+
+    assert ipif._request_single_object_by_id("TEST", "Persons", "anIdString") == {
+        "@id": "anIdString"
+    }
+    # Stale straight away, so revalidated; the 304 keeps the cached data
+    assert ipif._request_single_object_by_id("TEST", "Persons", "anIdString") == {
+        "@id": "anIdString"
+    }
+    assert requests_seen == [None, '"v1"']
+
+    # Within the freshness window, the cache is used without asking
+    ipif._revalidate_after = 60
+    ipif._request_single_object_by_id("TEST", "Persons", "anIdString")
+    assert len(requests_seen) == 2
+
+
+def test_request_single_object_by_id_keeps_validators_a_304_leaves_out(httpserver):
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request.headers.get("If-Modified-Since"))
+        if request.headers.get("If-Modified-Since"):
+            # Only the ETag is repeated
+            return Response(status=304, headers={"ETag": '"v1"'})
+        return Response(
+            json.dumps({"@id": "anIdString"}),
+            content_type="application/json",
+            headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Mar 2021 00:00:00 GMT"},
+        )
+
+    httpserver.expect_request("/persons/anIdString").respond_with_handler(handler)
+
+    ipif = IPIF({"revalidate_after": 0})
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+
+    for _ in range(3):
+        assert ipif._request_single_object_by_id("TEST", "Persons", "anIdString") == {
+            "@id": "anIdString"
+        }
+    assert requests_seen == [None] + ["Mon, 01 Mar 2021 00:00:00 GMT"] * 2
+
+
+def test_request_single_object_by_id_keeps_stale_data_if_revalidation_fails(
+    httpserver,
+):
+    httpserver.expect_oneshot_request("/persons/anIdString").respond_with_json(
+        {"@id": "anIdString"}, headers={"ETag": '"v1"'}
+    )
+    httpserver.expect_request("/persons/anIdString").respond_with_data(
+        "Oops", status=500
+    )
+
+    ipif = IPIF({"revalidate_after": 0, "retries": 0})
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+    cache_key = ("TEST", "Persons", "anIdString")
+
+    ipif._request_single_object_by_id(*cache_key)
+    for _ in range(2):
+        assert ipif._request_single_object_by_id(*cache_key) == {"@id": "anIdString"}
+    assert len(httpserver.log) == 3
+    assert ipif._data_cache.lookup(cache_key) == (True, {"@id": "anIdString"})
+
+    # Nor if the endpoint can't be reached at all
+    ipif._endpoints["TEST"] = "http://no/"
+    assert ipif._request_single_object_by_id(*cache_key) == {"@id": "anIdString"}
+
+
 def test_request_id_from_endpoints(httpserver):
 
     httpserver.expect_request("/succeed/persons/anIdString").respond_with_json(
@@ -142,7 +255,7 @@ def test_request_id_from_endpoints(httpserver):
         "Not found", status=404
     )
 
-    ipif = IPIF()
+    ipif = IPIF({"retries": 0})
     ipif.add_endpoint("TEST_SUCCEED", uri=httpserver.url_for("/succeed/"))
     ipif.add_endpoint("TEST_NOT_FOUND", uri=httpserver.url_for("/notFound/"))
     ipif.add_endpoint("TEST_NOSERVER", uri="http://not_there.net")
@@ -153,6 +266,47 @@ def test_request_id_from_endpoints(httpserver):
     assert "TEST_NOT_FOUND" not in result
 
 
+def test_request_id_from_endpoints_requests_endpoints_concurrently(mocker):
+    def slow_request(self, endpoint_name, ipif_type, id_string):
+        time.sleep(0.2)
+        return {"@id": f"{endpoint_name}_{id_string}"}
+
+    mocker.patch.object(IPIF, "_request_single_object_by_id", new=slow_request)
+
+    ipif = IPIF({"max_concurrent_requests": 4})
+    for name in ("A", "B", "C", "D"):
+        ipif.add_endpoint(name, uri=f"http://{name.lower()}/")
+
+    start = time.perf_counter()
+    result = ipif._request_id_from_endpoints("Persons", "anIdString")
+    elapsed = time.perf_counter() - start
+
+    # Four endpoints at once should take roughly as long as one
+    assert elapsed < 0.6
+    assert list(result) == ["A", "B", "C", "D"]
+    assert result["C"] == {"@id": "C_anIdString"}
+
+    result = ipif._request_id_from_endpoints(
+        "Persons", "anIdString", specify_endpoints={"B", "D"}
+    )
+    assert list(result) == ["B", "D"]
+
+
+def test_request_single_object_by_id_timeout(httpserver):
+    def slow_handler(request):
+        time.sleep(0.5)
+        return Response("{}", content_type="application/json")
+
+    httpserver.expect_request("/persons/slow").respond_with_handler(slow_handler)
+
+    ipif = IPIF({"timeout": 0.1, "retries": 0})
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+
+    assert ipif._request_single_object_by_id("TEST", "Persons", "slow") == {
+        "IPIF_STATUS": "Request failed"
+    }
+
+
 def test_doing_id_request_from_ipif_type(httpserver):
     httpserver.expect_request(
         f"/persons/{TEST_PERSON_RESPONSE['@id']}"
@@ -185,10 +339,10 @@ def test_id_functions_raise_error_on_own_class():
 
 
 def test_id_function_uses_cache_if_possible(mocker):
-    ipif = IPIF()
+    ipif = IPIF({"retries": 0})
     ipif.add_endpoint("TEST", uri="http://test")
 
-    requester = mocker.spy(requests, "get")
+    requester = mocker.spy(ipif._session, "get")
 
     ipif._data_cache[
         ("TEST", "persons", TEST_PERSON_RESPONSE["@id"])
@@ -204,7 +358,7 @@ def test_id_function_uses_cache_if_possible(mocker):
 
 
 def test_id_function_returns_a_factoid_or_statement():
-    ipif = IPIF()
+    ipif = IPIF({"retries": 0})
 
     ipif.add_endpoint("WORKS", "http://works/")
     ipif.add_endpoint("OTHER", "http://other/")
@@ -255,7 +409,7 @@ def test_id_function_with_factoid_or_statement_two_matches():
         ipif.Factoids.id("factoid__39986__original_source_3994")
 
 
-def test_simple_reconcile_persons_from_id():
+def test_get_by_id_reconciles_persons(mocker):
     ipif = IPIF()
     ipif._preferred_endpoint = "ENDPOINT_B"
     ipif.add_endpoint("ENDPOINT_A", "http://a")
@@ -303,14 +457,22 @@ def test_simple_reconcile_persons_from_id():
         ],
     }
 
-    endpoint_name, p_dict = ipif.Persons._reconcile_persons_from_id(
-        {
+    mocker.patch.object(
+        ipif,
+        "_request_id_from_endpoints",
+        return_value={
             "ENDPOINT_A": PERSON_RESPONSE_A,
             "ENDPOINT_B": PERSON_RESPONSE_B,
-        }
+        },
     )
+    hound = mocker.spy(ipif.Persons, "_hound_alternative_uris")
+
+    p = ipif.Persons.id("39986")
 
-    assert p_dict
+    # Every endpoint had the person, so there is nothing to hound for
+    assert hound.call_count == 0
+    assert p.id == "ENDPOINT_B::some_B_resp"
+    p_dict = p._data_dict
 
     assert p_dict["factoid-refs"] == [
         {
@@ -341,7 +503,7 @@ def test_simple_reconcile_persons_from_id():
     )
 
 
-def test_reconcile_persons_from_id_with_extra_hounding(mocker):
+def test_get_by_id_reconciles_persons_with_extra_hounding(mocker):
     ipif = IPIF()
     ipif._preferred_endpoint = "ENDPOINT_A"
     ipif.add_endpoint("ENDPOINT_A", "http://a")
@@ -395,11 +557,18 @@ def test_reconcile_persons_from_id_with_extra_hounding(mocker):
 
     requester = mocker.spy(IPIF, "_request_single_object_by_id")
 
-    p_endpoint_name, p_dict = ipif.Persons._reconcile_persons_from_id(
-        {"ENDPOINT_A": PERSON_RESPONSE_A, "ENDPOINT_B": None}
+    mocker.patch.object(
+        ipif,
+        "_request_id_from_endpoints",
+        return_value={"ENDPOINT_A": PERSON_RESPONSE_A, "ENDPOINT_B": None},
     )
 
+    p = ipif.Persons.id("39986")
+
+    # Only the hound mode request for B, by A's URI for the person
     assert requester.call_count == 1
+    assert p.id == "ENDPOINT_A::http://a/39986"
+    p_dict = p._data_dict
 
     assert len(p_dict["factoid-refs"]) == 2
     assert p_dict["factoid-refs"] == [
@@ -571,6 +740,52 @@ def test_ipif_client_iterate_results_from_single_endpoint_with_error(
     assert list(results_iterator) == [{"IPIF_STATUS": "Request failed"}]
 
 
+def test_ipif_client_iterate_results_prefetches_pages_in_order(mocker):
+    def slow_query_request(self, endpoint_name, ipif_type, search_params):
+        # Later pages come back faster, to check ordering is kept
+        time.sleep(0.05 * (10 - search_params["page"]))
+        return fake_iterated_response(270, search_params["size"], search_params["page"])
+
+    mocker.patch.object(IPIF, "_base_query_request", new=slow_query_request)
+
+    ipif = IPIF({"page_prefetch": 9})
+    ipif.add_endpoint("APIS", uri="http://apis/")
+
+    start = time.perf_counter()
+    results = list(
+        ipif._iterate_results_from_single_endpoint(
+            "APIS", "Persons", {"sourceId": "someSourceId"}
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    assert results == [{"@id": f"ID_{n}"} for n in range(1, 271)]
+    # Sequentially this would take 2.25 seconds
+    assert elapsed < 1.2
+
+
+def test_ipif_client_iterate_results_stops_at_failed_page(mocker):
+    def failing_query_request(self, endpoint_name, ipif_type, search_params):
+        if search_params["page"] == 3:
+            return None
+        return fake_iterated_response(100, search_params["size"], search_params["page"])
+
+    mocker.patch.object(IPIF, "_base_query_request", new=failing_query_request)
+    mocker.patch("ipif_client.ipif.timeout_wrapper", new=no_time_out)
+
+    ipif = IPIF()
+    ipif.add_endpoint("APIS", uri="http://apis/")
+
+    results = list(
+        ipif._iterate_results_from_single_endpoint(
+            "APIS", "Persons", {"sourceId": "someSourceId"}
+        )
+    )
+
+    assert len(results) == 61
+    assert results[-1] == {"IPIF_STATUS": "Request failed for page 3"}
+
+
 def test_search_queries_return_queryset_of_right_type():
     ipif = IPIF()
 
@@ -658,53 +873,147 @@ def test_query_requests_from_endpoints(httpserver):
 
 
 def test_queryset_makes_request_only_when_data_required(mocker):
-    RESULTS = {"ENDPOINT-A": ["endpointAThing"], "ENDPOINT-B": ["endpointBThing"]}
+    RESULTS = {
+        "ENDPOINT-A": [{"@id": "endpointAThing"}],
+        "ENDPOINT-B": [{"@id": "endpointBThing"}],
+    }
 
-    mocked_query_request_from_endpoints = mocker.patch.object(
+    def iterate_results(self, endpoint_name, ipif_type, search_params):
+        yield from RESULTS[endpoint_name]
+
+    mocked_iterate_results = mocker.patch.object(
         IPIF,
-        "_query_request_from_endpoints",
+        "_iterate_results_from_single_endpoint",
         autospec=True,
-        return_value=RESULTS,
+        side_effect=iterate_results,
     )
 
     ipif = IPIF()
-
-    # Check we've mocked this properly...
-    assert (
-        ipif._query_request_from_endpoints("Persons", {"sourceId": "someSourceId"})
-        == RESULTS
-    )
-    assert mocked_query_request_from_endpoints.call_count == 1
-    mocked_query_request_from_endpoints.reset_mock()
-    assert mocked_query_request_from_endpoints.call_count == 0
+    ipif.add_endpoint("ENDPOINT-A", "http://a/")
+    ipif.add_endpoint("ENDPOINT-B", "http://b/")
+    # The queryset is not reconciled, so each endpoint's results are streamed
+    # in turn
 
     # Right, now to business...
 
     qs = ipif.Persons.factoidId("aFactoidId")
 
     # It should not have been called by just building a queryset
-    assert mocked_query_request_from_endpoints.call_count == 0
+    assert mocked_iterate_results.call_count == 0
 
     for person in qs:
         pass
 
-    assert mocked_query_request_from_endpoints.call_count == 1
+    # Once for each endpoint
+    assert mocked_iterate_results.call_count == 2
 
-    mocked_query_request_from_endpoints.reset_mock()
-    qs._data = []
+    mocked_iterate_results.reset_mock()
 
+    # Only the first endpoint is needed for the first result
     p = qs.first()
+    assert p.id == "ENDPOINT-A::endpointAThing"
+    assert mocked_iterate_results.call_count == 1
 
-    assert mocked_query_request_from_endpoints.call_count == 1
+    mocked_iterate_results.reset_mock()
 
-    mocked_query_request_from_endpoints.reset_mock()
-    qs._data = []
+    p = qs[1]
+    assert p.id == "ENDPOINT-B::endpointBThing"
+    assert mocked_iterate_results.call_count == 2
 
-    p = qs[0]
+    with pytest.raises(IndexError):
+        qs[2]
 
-    assert mocked_query_request_from_endpoints.call_count == 1
+    assert [p.id for p in qs[:1]] == ["ENDPOINT-A::endpointAThing"]
+
+    assert [p.id for p in qs] == [
+        "ENDPOINT-A::endpointAThing",
+        "ENDPOINT-B::endpointBThing",
+    ]
+    assert all(isinstance(p, ipif.Persons) for p in qs)
+
+
+def test_queryset_streams_pages_as_needed(httpserver):
+    for i in range(4):
+        httpserver.expect_request(
+            "/persons",
+            query_string={"sourceId": "someSourceId", "page": str(i + 1), "size": "30"},
+        ).respond_with_json(fake_iterated_response(100, 30, i + 1))
+
+    ipif = IPIF({"page_prefetch": 1})
+    ipif.add_endpoint("APIS", uri=httpserver.url_for("/"))
 
-    assert list(qs) == ["endpointAThing", "endpointBThing"]
+    qs = ipif.Persons.sourceId("someSourceId")
+
+    results = iter(qs)
+    assert next(results).id == "APIS::ID_1"
+    # Page 1, and page 2 being prefetched, but not the rest
+    assert len(httpserver.log) <= 2
+    results.close()
+
+    httpserver.clear_log()
+    assert [p.id for p in qs[:10]] == [f"APIS::ID_{n}" for n in range(1, 11)]
+    assert len(httpserver.log) <= 2
+
+    assert len(list(qs)) == 100
+
+
+def test_ipif_client_streams_results_from_single_endpoint(httpserver):
+    responses = [fake_iterated_response(100, 30, i + 1) for i in range(4)]
+    for i in range(4):
+        httpserver.expect_request(
+            "/persons",
+            query_string={"sourceId": "someSourceId", "page": str(i + 1), "size": "30"},
+        ).respond_with_json(responses[i])
+
+    ipif = IPIF({"stream": True})
+    ipif.add_endpoint("APIS", uri=httpserver.url_for("/"))
+
+    results = list(
+        ipif._iterate_results_from_single_endpoint(
+            "APIS", "Persons", {"sourceId": "someSourceId"}
+        )
+    )
+    assert results == list(yield_responses(responses))
+
+    # Each page is cached once it has all been read
+    httpserver.clear_log()
+    assert [p.id for p in ipif.Persons.sourceId("someSourceId")] == [
+        f"APIS::ID_{n}" for n in range(1, 101)
+    ]
+    assert len(httpserver.log) == 0
+
+
+def test_ipif_client_streamed_results_stop_at_failed_page(httpserver):
+    httpserver.expect_request(
+        "/persons", query_string={"page": "1", "size": "30"}
+    ).respond_with_json(fake_iterated_response(100, 30, 1))
+    httpserver.expect_request(
+        "/persons", query_string={"page": "2", "size": "30"}
+    ).respond_with_data("Oops", status=500)
+
+    ipif = IPIF({"stream": True, "retries": 0})
+    ipif.add_endpoint("APIS", uri=httpserver.url_for("/"))
+
+    results = list(ipif._iterate_results_from_single_endpoint("APIS", "Persons", {}))
+    assert len(results) == 31
+    assert results[-1] == {"IPIF_STATUS": "Request failed for page 2"}
+
+
+def test_ipif_client_decodes_with_configured_json_library(httpserver, mocker):
+    orjson = pytest.importorskip("orjson")
+    httpserver.expect_request("/persons/anIdString").respond_with_json(
+        {"@id": "anIdString"}
+    )
+    loads = mocker.Mock(wraps=orjson.loads)
+    mocker.patch("ipif_client.ipif.json_loads", return_value=loads)
+
+    ipif = IPIF({"json_library": "orjson"})
+    ipif.add_endpoint("APIS", uri=httpserver.url_for("/"))
+
+    assert ipif._request_single_object_by_id("APIS", "Persons", "anIdString") == {
+        "@id": "anIdString"
+    }
+    loads.assert_called_once()
 
 
 """
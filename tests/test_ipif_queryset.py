@@ -1,4 +1,12 @@
+import time
+
+import pytest
+
 from ipif_client import IPIF
+from ipif_client.exceptions import IPIFClientQueryError
+
+from .test_data import TEST_FACTOID_RESPONSE
+from .test_ipif_client import fake_iterated_response
 
 P1 = {
     "@id": "http://APIS/39986",
@@ -71,4 +79,293 @@ def test_queryset_merge_persons():
     ipif = IPIF()
     qs = ipif._PersonsQuerySet()
 
-    qs._merge_results_set(DATA)
+    assert qs._merge_results_set(DATA) == []
+
+    merged = qs._merge_results_set({"endpointA": [P1, P3], "endpointB": [P2]})
+
+    assert [(e, d["@id"]) for e, d in merged] == [
+        ("endpointA", "http://APIS/39986"),
+        ("endpointA", "COMPLETELY_DIFFERENT_ONE"),
+    ]
+    assert merged[0][1]["factoid-refs"] == [
+        {**P1["factoid-refs"][0], "ipif-endpoint": "endpointA"},
+        {**P2["factoid-refs"][0], "ipif-endpoint": "endpointB"},
+    ]
+    assert set(merged[0][1]["uris"]) == {
+        "http://d-nb.info/gnd/1031597824",
+        "http://APIS/39986",
+    }
+    # The originals are left alone
+    assert "ipif-endpoint" not in P1["factoid-refs"][0]
+
+
+def test_queryset_merge_follows_chains_of_uris():
+    A = {"@id": "a1", "uris": ["http://x"], "factoid-refs": [{"@id": "fa"}]}
+    B = {"@id": "b1", "uris": ["http://y"], "factoid-refs": [{"@id": "fb"}]}
+    # Only C links A and B
+    C = {"@id": "c1", "uris": ["http://x", "http://y"], "factoid-refs": []}
+
+    ipif = IPIF()
+    ipif._preferred_endpoint = "endpointB"
+    qs = ipif._PersonsQuerySet()
+
+    merged = qs._merge_results_set(
+        {"endpointA": [A], "endpointB": [B], "endpointC": [C]}
+    )
+
+    assert len(merged) == 1
+    endpoint_name, data = merged[0]
+    assert endpoint_name == "endpointB"
+    assert data["@id"] == "b1"
+    assert [f["@id"] for f in data["factoid-refs"]] == ["fb", "fa"]
+
+
+def test_queryset_merge_does_not_link_endpoints_by_local_id():
+    # Two different people who happen to have the same local @id
+    A = {"@id": "39986", "uris": ["http://gnd/a"], "factoid-refs": [{"@id": "fa"}]}
+    B = {"@id": "39986", "uris": ["http://gnd/b"], "factoid-refs": [{"@id": "fb"}]}
+
+    ipif = IPIF()
+    qs = ipif._PersonsQuerySet()
+
+    merged = qs._merge_results_set({"endpointA": [A], "endpointB": [B]})
+
+    assert [(e, d["uris"]) for e, d in merged] == [
+        ("endpointA", ["http://gnd/a"]),
+        ("endpointB", ["http://gnd/b"]),
+    ]
+    # But the same @id twice from one endpoint is the same entity
+    assert len(qs._merge_results_set({"endpointA": [A, {"@id": "39986"}]})) == 1
+
+
+def test_queryset_merge_is_not_quadratic():
+    DATA = {
+        endpoint_name: [
+            {"@id": f"{endpoint_name}{n}", "uris": [f"http://gnd/{n}"]}
+            for n in range(20000)
+        ]
+        for endpoint_name in ("a", "b", "c")
+    }
+
+    ipif = IPIF()
+    qs = ipif._PersonsQuerySet()
+
+    start = time.perf_counter()
+    merged = qs._merge_results_set(DATA)
+    assert time.perf_counter() - start < 2
+
+    assert len(merged) == 20000
+
+
+def test_queryset_iteration_reconciles_persons(mocker):
+    RESULTS = {"endpointA": [P1, P3], "endpointB": [P2]}
+
+    def iterate_results(
+        self, endpoint_name, ipif_type, search_params, statement_params={}
+    ):
+        yield from RESULTS[endpoint_name]
+
+    mocker.patch.object(
+        IPIF,
+        "_iterate_results_from_single_endpoint",
+        autospec=True,
+        side_effect=iterate_results,
+    )
+
+    ipif = IPIF()
+    ipif.add_endpoint("endpointA", "http://a/")
+    ipif.add_endpoint("endpointB", "http://b/")
+
+    # Only if asked for, as it needs all the results first
+    qs = ipif.Persons.sourceId("original_source_3994")
+    assert len(list(qs)) == 3
+    assert qs.reconcile().prefetch("factoids").s("x")._reconcile
+
+    persons = list(qs.reconcile())
+
+    assert [p.id for p in persons] == [
+        "endpointA::http://APIS/39986",
+        "endpointA::COMPLETELY_DIFFERENT_ONE",
+    ]
+    assert [f.id for f in persons[0].factoids] == [
+        "factoid__39986__original_source_3994",
+        "anotherFactoidId",
+    ]
+
+
+def test_queryset_streams_from_several_endpoints(httpserver, mocker):
+    for endpoint_name in ("A", "B"):
+        for page in range(1, 11):
+            httpserver.expect_request(
+                f"/{endpoint_name}/persons",
+                query_string={"sourceId": "s", "page": str(page), "size": "30"},
+            ).respond_with_json(fake_iterated_response(300, 30, page))
+
+    ipif = IPIF({"page_prefetch": 1})
+    ipif.add_endpoint("A", uri=httpserver.url_for("/A/"))
+    ipif.add_endpoint("B", uri=httpserver.url_for("/B/"))
+
+    assert ipif.Persons.sourceId("s").first().id == "A::ID_1"
+    assert len(httpserver.log) <= 2
+
+    # Reconciling fetches everything, from both endpoints concurrently
+    httpserver.clear_log()
+    rounds = mocker.spy(ipif, "_run_concurrently")
+    persons = list(ipif.Persons.sourceId("s").reconcile())
+    # Same local @ids, but no shared uris, so different people
+    assert len(persons) == 600
+    # (The first page from A was cached)
+    assert len(httpserver.log) == 19
+    assert rounds.call_args_list[0].args[1] == [("A",), ("B",)]
+
+
+def test_queryset_prefetch_accumulates_and_validates_paths():
+    ipif = IPIF()
+
+    qs = ipif.Persons.sourceId("someSourceId").prefetch("factoids.statements")
+    qs = qs.prefetch("factoids.source", "factoids.statements").factoidId("f")
+
+    assert qs._prefetch_paths == ("factoids.statements", "factoids.source")
+    assert qs._search_params == {"sourceId": "someSourceId", "factoidId": "f"}
+
+    with pytest.raises(IPIFClientQueryError):
+        qs.prefetch("factoids.nonsense")
+
+
+def test_queryset_prefetch_hydrates_related_objects(mocker):
+    mocker.patch.object(
+        IPIF,
+        "_iterate_results_from_single_endpoint",
+        autospec=True,
+        return_value=iter([P1, P3]),
+    )
+
+    ipif = IPIF()
+    ipif.add_endpoint("endpointA", "http://a/")
+
+    for statement_id in (
+        "39986_PersonInstitution_95989",
+        "39986_PersonInstitution_95994",
+        "nothingToDoWithIt1",
+        "nothingToDoWithIt2",
+    ):
+        ipif._data_cache[("endpointA", "statements", statement_id)] = {
+            "@id": statement_id,
+            "name": f"Name of {statement_id}",
+        }
+    ipif._data_cache[("endpointA", "sources", "original_source_3994")] = {
+        "@id": "original_source_3994",
+        "label": "Original source 3994",
+    }
+
+    requester = mocker.spy(ipif, "_request_single_object_by_id")
+
+    persons = list(
+        ipif.Persons.sourceId("original_source_3994").prefetch(
+            "factoids.statements", "factoids.source"
+        )
+    )
+
+    assert [p.id for p in persons] == [
+        "endpointA::http://APIS/39986",
+        "endpointA::COMPLETELY_DIFFERENT_ONE",
+    ]
+    # Four statements, and one source shared by both persons' factoids
+    assert requester.call_count == 5
+
+    statement = persons[1].factoids[0].statements[1]
+    assert statement._ref_only is False
+    assert statement.name == "Name of nothingToDoWithIt2"
+    assert persons[0].factoids[0].source.label == "Original source 3994"
+    assert requester.call_count == 5
+
+
+def test_queryset_prefetch_factoids_hydrates_the_factoids(mocker):
+    mocker.patch.object(
+        IPIF,
+        "_iterate_results_from_single_endpoint",
+        autospec=True,
+        return_value=iter([P1, P3]),
+    )
+
+    ipif = IPIF()
+    ipif.add_endpoint("endpointA", "http://a/")
+
+    for factoid_id in (
+        "factoid__39986__original_source_3994",
+        "NothingToDoWithItFactoid",
+    ):
+        ipif._data_cache[("endpointA", "factoids", factoid_id)] = {
+            **TEST_FACTOID_RESPONSE,
+            "@id": factoid_id,
+        }
+
+    requester = mocker.spy(ipif, "_request_single_object_by_id")
+
+    persons = list(ipif.Persons.sourceId("original_source_3994").prefetch("factoids"))
+
+    assert requester.call_count == 2
+    for person in persons:
+        factoid = person.factoids[0]
+        assert factoid._ref_only is False
+        assert factoid.createdWhen.isoformat() == "2016-10-03T20:53:28+00:00"
+    assert requester.call_count == 2
+
+
+def test_queryset_yields_results_as_they_arrive_unless_prefetching(mocker):
+    consumed = []
+
+    def results(self, endpoint_name, ipif_type, search_params):
+        for n in range(100):
+            consumed.append(n)
+            yield {"@id": f"ID_{n}"}
+
+    mocker.patch.object(
+        IPIF,
+        "_iterate_results_from_single_endpoint",
+        autospec=True,
+        side_effect=results,
+    )
+
+    ipif = IPIF()
+    ipif.add_endpoint("endpointA", "http://a/")
+
+    assert ipif.Persons.sourceId("x").first().id == "endpointA::ID_0"
+    assert len(consumed) == 1
+
+    # Prefetching waits for a page, to fetch its refs together
+    consumed.clear()
+    assert ipif.Persons.sourceId("x").prefetch("factoids").first()
+    assert len(consumed) == ipif._DEFAULT_PAGE_REQUEST_SIZE
+
+
+def test_queryset_count_uses_total_hits(mocker):
+    RESPONSES = {
+        "endpointA": {"protocol": {"totalHits": 100}, "persons": [P1, P3]},
+        "endpointB": {"protocol": {"totalHits": 50}, "persons": [P2]},
+    }
+
+    def query_request(self, endpoint_name, ipif_type, search_params):
+        return RESPONSES[endpoint_name]
+
+    requester = mocker.patch.object(
+        IPIF, "_base_query_request", autospec=True, side_effect=query_request
+    )
+
+    ipif = IPIF()
+    ipif.add_endpoint("endpointA", "http://a/")
+    ipif.add_endpoint("endpointB", "http://b/")
+
+    qs = ipif.Persons.sourceId("original_source_3994")
+
+    assert qs.count() == 150
+    # A single one-result request per endpoint
+    assert requester.call_count == 2
+    assert {c.args[3]["size"] for c in requester.call_args_list} == {1}
+
+    # The totals are kept
+    assert qs.count() == 150
+    assert requester.call_count == 2
+
+    # P2 is the same person as P1, so a third of the sample are duplicates
+    assert qs.count(deduplicate=True) == 100
@@ -1,4 +1,8 @@
 import datetime
+import gc
+
+import pytest
+
 from ipif_client.ipif import IPIF
 from ipif_client.ipif_entity_types import Statements
 
@@ -54,6 +58,23 @@ def test_create_source_from_init_json():
     assert isinstance(s.factoids[0].statements[0], ipif.Statements)
 
 
+def test_entities_are_compact():
+    ipif = IPIF({"keep_data_dict": False})
+
+    p = ipif.Persons._init_from_id_json(TEST_PERSON_RESPONSE, endpoint_name="APIS")
+    ref = ipif.Persons._init_from_ref_json({"@id": "39986"})
+
+    for entity in (p, ref, p.factoids[0], p.factoids[0].statements[0]):
+        assert type(entity).__dictoffset__ == 0
+    assert p.id == "APIS::39986"
+    assert ref.id == "39986"
+    assert p.label == "Schneller, István (39986)"
+
+    # The raw data was not kept
+    with pytest.raises(KeyError):
+        p["@id"]
+
+
 def test_create_factoid_from_init_json():
     ipif = IPIF()
 
@@ -239,3 +260,86 @@ def test_ipif_type_gets_full_item_when_accessed():
         }
     ],
 }
+
+
+def test_hydrate_fetches_refs_in_bulk(mocker):
+    ipif = IPIF()
+    ipif.add_endpoint("TEST", "http://test/")
+
+    ipif._data_cache[
+        ("TEST", "statements", "39986_PersonInstitution_95989")
+    ] = TEST_STATEMENT_RESPONSE
+    ipif._data_cache[("TEST", "sources", "original_source_3994")] = TEST_SOURCE_RESPONSE
+
+    factoid_refs = [
+        {
+            "@id": factoid_id,
+            "statement-refs": [{"@id": "39986_PersonInstitution_95989"}],
+            "source-ref": {"@id": "original_source_3994"},
+            "person-ref": {"@id": "39986"},
+        }
+        for factoid_id in ("f1", "f2")
+    ]
+    for factoid_ref in factoid_refs:
+        ipif._data_cache[("TEST", "factoids", factoid_ref["@id"])] = {
+            **factoid_ref,
+            "createdWhen": "2016-10-03T20:53:28Z",
+        }
+    f1, f2 = (ipif.Factoids._init_from_ref_json(f, "TEST") for f in factoid_refs)
+    ipif._data_cache[("TEST", "persons", "39986")] = None
+
+    requester = mocker.spy(ipif, "_request_single_object_by_id")
+
+    assert ipif.hydrate([f1, f2], depth=1) == [f1, f2]
+
+    # The factoid-refs are fetched, then the same statement, source and
+    # person are each requested once
+    assert requester.call_count == 5
+
+    for f in (f1, f2):
+        assert f._ref_only is False
+        assert f.createdWhen == datetime.datetime(2016, 10, 3, 20, 53, 28)
+        assert f.statements[0]._ref_only is False
+        assert f.statements[0].name == "Lebowski, Lebowski"
+        assert f.source.label == "Original source  3994"
+        # Not found, so still a ref
+        assert f.person._ref_only is True
+
+    # Nothing more was needed to access those attributes
+    assert requester.call_count == 5
+
+
+def test_refs_to_the_same_entity_share_one_object(mocker):
+    ipif = IPIF()
+    ipif.add_endpoint("TEST", "http://test/")
+    ipif._data_cache[("TEST", "sources", "original_source_3994")] = TEST_SOURCE_RESPONSE
+
+    factoids = [
+        ipif.Factoids._init_from_ref_json(
+            {
+                "@id": f"f{n}",
+                "source-ref": {"@id": "original_source_3994"},
+                "person-ref": {"@id": "39986"},
+            },
+            "TEST",
+        )
+        for n in range(500)
+    ]
+    source = factoids[0].source
+    assert all(f.source is source for f in factoids)
+
+    # Refs from another endpoint are different entities
+    other = ipif.Sources._init_from_ref_json({"@id": "original_source_3994"}, "OTHER")
+    assert other is not source
+
+    requester = mocker.spy(ipif, "_request_single_object_by_id")
+    assert factoids[-1].source.uris == ["/apis/api/metainfo/source/3994/"]
+    assert factoids[0].source._ref_only is False
+    assert requester.call_count == 1
+
+
+def test_identity_map_does_not_keep_refs_alive():
+    ipif = IPIF()
+    ipif.Persons._init_from_ref_json({"@id": "39986"}, "TEST")
+    gc.collect()
+    assert len(ipif._identity_map) == 0
@@ -0,0 +1,94 @@
+import json
+import sys
+
+import pytest
+
+from ipif_client.exceptions import IPIFClientConfigurationError
+from ipif_client.utils.jsonlib import SearchPageParser, json_loads
+
+PAGE = {
+    "persons": [
+        {"@id": "P1", "uris": ["a", "b"], "factoids": [{"@id": "F1"}]},
+        {"@id": "P2", "uris": [], "factoids": []},
+        "P3",
+    ],
+    "protocol": {"size": 3, "totalHits": 3, "page": 1},
+}
+
+
+def feed_in_chunks(parser, body, size):
+    fed = []
+    for i in range(0, len(body), size):
+        fed.append(parser.feed(body[i : i + size]))
+    fed.append(parser.close())
+    return fed
+
+
+def test_json_loads():
+    assert json_loads() is json.loads
+    assert json_loads("json") is json.loads
+    assert json_loads("auto")(b'{"a": [1, 2.5]}') == {"a": [1, 2.5]}
+
+    with pytest.raises(IPIFClientConfigurationError):
+        json_loads("simplejson")
+
+
+def test_json_loads_with_orjson():
+    orjson = pytest.importorskip("orjson")
+    assert json_loads("orjson") is orjson.loads
+    assert json_loads("auto") is orjson.loads
+
+
+def test_json_loads_library_not_installed(monkeypatch):
+    monkeypatch.setitem(sys.modules, "ujson", None)
+    with pytest.raises(IPIFClientConfigurationError, match="not installed"):
+        json_loads("ujson")
+
+
+def test_search_page_parser_yields_results_as_they_arrive():
+    pytest.importorskip("ijson")
+    body = json.dumps(PAGE).encode()
+    parser = SearchPageParser("persons")
+
+    fed = feed_in_chunks(parser, body, 1)
+
+    # Each result comes out as soon as its last byte has been fed
+    results = [result for results in fed for result in results]
+    assert results == PAGE["persons"]
+    end_of_first = body.index(b"}]}") + 3
+    assert fed[end_of_first - 1] == [PAGE["persons"][0]]
+    assert parser.protocol == PAGE["protocol"]
+
+
+def test_search_page_parser_keeps_numbers_as_floats():
+    pytest.importorskip("ijson")
+    parser = SearchPageParser("persons")
+    results = parser.feed(b'{"persons": [{"n": 1.5}], "protocol": {"totalHits": 1}}')
+    assert results == [{"n": 1.5}]
+    assert isinstance(results[0]["n"], float)
+
+
+def test_search_page_parser_without_ijson(monkeypatch):
+    monkeypatch.setitem(sys.modules, "ijson", None)
+    body = json.dumps(PAGE).encode()
+    parser = SearchPageParser("persons")
+
+    fed = feed_in_chunks(parser, body, 10)
+
+    # Everything is parsed in one go at the end
+    assert all(results == [] for results in fed[:-1])
+    assert fed[-1] == PAGE["persons"]
+    assert parser.protocol == PAGE["protocol"]
+
+
+@pytest.mark.parametrize("has_ijson", [True, False])
+def test_search_page_parser_invalid_json(monkeypatch, has_ijson):
+    if has_ijson:
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setitem(sys.modules, "ijson", None)
+    parser = SearchPageParser("persons")
+
+    with pytest.raises(ValueError):
+        parser.feed(b'{"persons": [{"@id": "P1"}')
+        parser.close()
@@ -0,0 +1,62 @@
+import subprocess
+import sys
+
+from ipif_client.ipif import IPIF
+from ipif_client.progress import (
+    NullProgress,
+    SpinnerProgress,
+    auto_progress,
+    progress_factory,
+)
+
+
+class RecordingProgress(NullProgress):
+    def __init__(self, text=""):
+        super().__init__(text)
+        self.lines = []
+        RecordingProgress.instances.append(self)
+
+    def write(self, message):
+        self.lines.append(message)
+
+
+def test_progress_factory():
+    assert progress_factory(True) is SpinnerProgress
+    assert progress_factory(False) is NullProgress
+    assert progress_factory("auto") is auto_progress
+    assert progress_factory(RecordingProgress) is RecordingProgress
+
+    # Not run in a terminal
+    assert isinstance(auto_progress(), NullProgress)
+
+
+def test_ipif_reports_progress_to_progress_reporter(mocker):
+    RecordingProgress.instances = []
+    mocker.patch.object(
+        IPIF,
+        "_request_single_object_by_id",
+        side_effect=lambda endpoint_name, ipif_type, id_string: (
+            {"@id": id_string} if endpoint_name == "A" else None
+        ),
+    )
+
+    ipif = IPIF({"progress": RecordingProgress})
+    ipif.add_endpoint("A", uri="http://a/")
+    ipif.add_endpoint("B", uri="http://b/")
+    ipif._request_id_from_endpoints("Persons", "anIdString")
+
+    (progress,) = RecordingProgress.instances
+    assert progress.text == "Getting Persons @id='anIdString' from A, B"
+    assert sorted(progress.lines) == ["✅ A", "💥 B"]
+
+
+def test_yaspin_is_not_imported_unless_needed():
+    code = (
+        "import sys; from ipif_client.ipif import IPIF; "
+        "IPIF()._progress().__enter__(); "
+        "print('yaspin' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,73 @@
+import re
+import threading
+import time
+
+from werkzeug import Response
+
+from ipif_client.ipif import IPIF
+from ipif_client.ratelimit import TokenBucket
+
+from .test_health import FakeClock
+
+
+def test_token_bucket_allows_bursts_then_spaces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    # Further tokens are reserved in turn, half a second apart
+    assert [bucket.reserve() for _ in range(2)] == [0.5, 1.0]
+
+    clock.now = 10
+    assert bucket.reserve() == 0
+
+
+def test_endpoints_config_takes_per_endpoint_limits():
+    ipif = IPIF(
+        {
+            "endpoints": {
+                "PLAIN": "http://plain/",
+                "LIMITED": {
+                    "uri": "http://limited/",
+                    "rate_limit": 5,
+                    "max_in_flight": 2,
+                },
+            }
+        }
+    )
+
+    assert ipif._endpoints == {"PLAIN": "http://plain/", "LIMITED": "http://limited/"}
+    assert ipif._limits["PLAIN"].rate_limit is None
+    assert ipif._limits["LIMITED"].rate_limit == 5
+    assert ipif._limits["LIMITED"].max_in_flight == 2
+
+
+def test_ipif_keeps_to_endpoint_limits(httpserver):
+    lock = threading.Lock()
+    in_flight = 0
+    most_in_flight = 0
+
+    def handler(request):
+        nonlocal in_flight, most_in_flight
+        with lock:
+            in_flight += 1
+            most_in_flight = max(most_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return Response('{"@id": "x"}', content_type="application/json")
+
+    httpserver.expect_request(re.compile("/persons/.*")).respond_with_handler(handler)
+
+    ipif = IPIF({"max_concurrent_requests": 8})
+    ipif.add_endpoint(
+        "TEST", uri=httpserver.url_for("/"), rate_limit=50, burst=2, max_in_flight=2
+    )
+
+    start = time.perf_counter()
+    ipif._request_ids_from_endpoints(("persons", f"id{n}") for n in range(8))
+    elapsed = time.perf_counter() - start
+
+    assert most_in_flight <= 2
+    # 2 at once, then 6 more at 50 a second
+    assert elapsed >= 0.12
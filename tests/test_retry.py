@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from ipif_client.ipif import IPIF
+from ipif_client.retry import RetryPolicy, retry_after_seconds
+
+from .test_data import TEST_PERSON_RESPONSE, TEST_PERSON_SEARCH_RESPONSE
+
+
+def test_retry_policy_only_retries_retryable_failures():
+    policy = RetryPolicy(jitter=False)
+
+    assert policy.next_delay(1, None) == 0.5
+    assert policy.next_delay(1, 503) == 0.5
+    assert policy.next_delay(1, 429) == 0.5
+    assert policy.next_delay(1, 400) is None
+    assert policy.next_delay(1, 404) is None
+
+
+def test_retry_policy_backs_off_exponentially_within_limits():
+    policy = RetryPolicy(max_attempts=5, backoff=1, max_backoff=5, jitter=False)
+
+    assert [policy.next_delay(a, 500) for a in range(1, 6)] == [1, 2, 4, 5, None]
+    assert all(0 <= RetryPolicy(backoff=1).next_delay(3, 500) <= 4 for _ in range(20))
+    # No retry that would run past the deadline
+    assert (
+        RetryPolicy(deadline=10, jitter=False).next_delay(1, 500, elapsed=9.8) is None
+    )
+
+
+def test_retry_policy_honours_retry_after():
+    policy = RetryPolicy(jitter=False)
+    assert policy.next_delay(1, 429, {"Retry-After": "3"}) == 3
+
+    in_a_minute = format_datetime(
+        datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True
+    )
+    assert 55 < retry_after_seconds({"Retry-After": in_a_minute}) <= 60
+    assert retry_after_seconds({"Retry-After": "whenever"}) is None
+
+
+def test_ipif_retries_server_errors_but_not_bad_requests(httpserver, mocker):
+    sleeps = mocker.patch("ipif_client.ipif.timeout_wrapper")
+
+    httpserver.expect_ordered_request("/persons/flaky").respond_with_data(
+        "Unavailable", status=503, headers={"Retry-After": "2"}
+    )
+    httpserver.expect_ordered_request("/persons/flaky").respond_with_json(
+        TEST_PERSON_RESPONSE
+    )
+    ipif = IPIF()
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+
+    assert (
+        ipif._request_single_object_by_id("TEST", "Persons", "flaky")
+        == TEST_PERSON_RESPONSE
+    )
+    sleeps.assert_called_once_with(2)
+
+    httpserver.clear()
+    httpserver.expect_request("/persons").respond_with_data("Bad query", status=400)
+    sleeps.reset_mock()
+
+    assert ipif._request_page("TEST", "Persons", {"bad": "param"}, 1, 30) is None
+    assert len(httpserver.log) == 1
+    sleeps.assert_not_called()
+
+
+def test_async_ipif_retries_without_blocking(httpserver):
+    pytest.importorskip("aiohttp")
+    from ipif_client import AsyncIPIF
+
+    httpserver.expect_ordered_request("/persons").respond_with_data(
+        "Unavailable", status=502
+    )
+    httpserver.expect_ordered_request("/persons").respond_with_json(
+        TEST_PERSON_SEARCH_RESPONSE
+    )
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        async with AsyncIPIF(
+            {"retry_policy": RetryPolicy(backoff=0.2, jitter=False)}
+        ) as ipif:
+            ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+            ticking = asyncio.ensure_future(ticker())
+            data = await ipif._base_query_request("TEST", "Persons", {"q": "x"})
+            ticking.cancel()
+            return data, ticks
+
+    data, ticks = asyncio.run(run())
+    assert data == TEST_PERSON_SEARCH_RESPONSE
+    # The event loop kept running while backing off
+    assert ticks > 5
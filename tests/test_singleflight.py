@@ -0,0 +1,134 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from werkzeug import Response
+
+from ipif_client.ipif import IPIF
+from ipif_client.utils.singleflight import AsyncSingleFlight, SingleFlight
+
+from .test_data import TEST_PERSON_RESPONSE
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow(x):
+        calls.append(x)
+        time.sleep(0.1)
+        return x * 2
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda _: single_flight.do("key", slow, 21), range(8))
+        )
+
+    assert results == [42] * 8
+    assert calls == [21]
+    assert len(single_flight) == 0
+
+    # Once done, the next call is made afresh
+    assert single_flight.do("key", slow, 1) == 2
+    assert calls == [21, 1]
+
+
+def test_single_flight_shares_errors():
+    single_flight = SingleFlight()
+    started = threading.Event()
+
+    def fails():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("nope")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(single_flight.do, "key", fails)
+        started.wait()
+        second = executor.submit(single_flight.do, "key", fails)
+        for future in (first, second):
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_async_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    async def slow(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return x * 2
+
+    async def run():
+        single_flight = AsyncSingleFlight()
+        return await asyncio.gather(
+            *(single_flight.do("key", slow, 21) for _ in range(8))
+        )
+
+    assert asyncio.run(run()) == [42] * 8
+    assert calls == [21]
+
+
+def test_async_single_flight_survives_the_first_caller_being_cancelled():
+    calls = []
+
+    async def slow(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return x * 2
+
+    async def run():
+        single_flight = AsyncSingleFlight()
+        first = asyncio.ensure_future(single_flight.do("key", slow, 21))
+        await asyncio.sleep(0)
+        followers = [
+            asyncio.ensure_future(single_flight.do("key", slow, 21)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        first.cancel()
+        results = await asyncio.gather(first, *followers, return_exceptions=True)
+        return results, len(single_flight)
+
+    results, in_flight = asyncio.run(run())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == [42, 42]
+    assert calls == [21]
+    assert in_flight == 0
+
+
+def test_async_single_flight_shares_errors():
+    async def fails():
+        await asyncio.sleep(0.01)
+        raise ValueError("nope")
+
+    async def run():
+        single_flight = AsyncSingleFlight()
+        return await asyncio.gather(
+            *(single_flight.do("key", fails) for _ in range(2)),
+            return_exceptions=True,
+        )
+
+    assert [type(e) for e in asyncio.run(run())] == [ValueError, ValueError]
+
+
+def test_concurrent_identical_lookups_make_one_request(httpserver):
+    def slow_handler(request):
+        time.sleep(0.1)
+        return Response(
+            json.dumps(TEST_PERSON_RESPONSE), content_type="application/json"
+        )
+
+    httpserver.expect_request("/persons/39986").respond_with_handler(slow_handler)
+
+    ipif = IPIF({"retries": 0})
+    ipif.add_endpoint("TEST", uri=httpserver.url_for("/"))
+    ipif._hound_mode = False
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        people = list(executor.map(lambda _: ipif.Persons.id("39986"), range(8)))
+
+    assert all(p.id == "TEST::39986" for p in people)
+    assert len(httpserver.log) == 1